@@ -8,12 +8,21 @@ argu = argparse.ArgumentParser()
 argu.add_argument('--file', required=True)
 argu.add_argument('--param', default=None)
 argu.add_argument('--verbose', action='store_true')
+argu.add_argument('--jit', action='store_true')
+argu.add_argument('--memo', action='store_true')
+argu.add_argument('--cache', action='store_true')
+argu.add_argument('--backend', choices=('python', 'tree'),
+                  default='python')
 argu.add_argument('--param_delim', default=',')
 
 def main(args):
 
-    numpad.VERBOSE = args.verbose
+    numpad.set_verbose(args.verbose)
+    numpad.MEMOIZE = args.memo
     numpadrun.VERBOSE = args.verbose
+    numpadrun.JIT = args.jit
+    numpadrun.DISK_CACHE = args.cache
+    numpadrun.BACKEND = args.backend
 
     final_value = numpadrun.run(
         args.file,
@@ -17,12 +17,85 @@ Importing this module will provide the following classes:
                    | equal 0.
     StatementWhile : Statement that runs its block as long as its expression
                    | doesn't equal 0.
+
+and the following functions:
+    to_slot        : Convert a variable name to the int slot it is stored
+                   | under.
+    to_name        : Convert an int slot back to its variable name.
+    param_slots    : Get the slots of a function's first parameters.
+    new_frame      : Create the list of variables held by a new scope.
+    set_verbose    : Choose between the quiet and verbose versions of every
+                   | evaluate and run method.
 """
 
+from decimal import Decimal
 from math import log
+from operator import add, eq, floordiv, gt, lt, mod, mul, pow, sub
 
+# Whether each step is printed as programs run. Change it with set_verbose.
+# numpadrun also applies a plain assignment before loading each program.
 VERBOSE = False
 
+# Whether calls to pure functions with int arguments are memoized.
+MEMOIZE = False
+
+# Largest result, in bits, that a constant power is folded to when loading.
+# Bigger powers are left to be computed if they ever run.
+FOLD_MAX_BITS = 1 << 16
+
+# Kinds of Expression, each evaluated by its own function in _EVAL.
+EXPR_INT = 0
+EXPR_SLOT = 1
+EXPR_LIST = 2
+
+# Ids of each operation, used to index DISPATCH.
+OP_IDS = {
+    '..': 0,
+    '.+': 1,
+    '.-': 2,
+    '+': 3,
+    '-': 4,
+    '*': 5,
+    '/': 6,
+    '*+': 7,
+    '*-': 8,
+    '/+': 9,
+    '/-': 10
+}
+
+# Comparisons a loop condition between a variable and an int can skip to.
+LOOP_COMPARISONS = {
+    '..': eq,
+    '.+': gt,
+    '.-': lt
+}
+
+# Ids of each pair of operand types, used to index a row of DISPATCH.
+INT_INT = 0
+LIST_INT = 1
+LIST_LIST = 2
+FUNC_LIST = 3
+INT_LIST = 4
+OTHER_TYPES = 5
+
+
+# Held by a scope for every slot it doesn't define.
+UNSET = object()
+
+# Variable numbers in the order their slots were handed out, and the slot of
+# each. Names starting with 0 are negated, so *01 is -1. *00 is always slot 0.
+#
+# These are shared by every program parsed in the process and never shrink.
+# Slots are handed out while parsing, before a program exists to own them,
+# and a variable keeps the same slot in every program, so parsed trees,
+# compiled code and cached frames can all be reused across loads. The cost
+# is that every scope's list of variables has a place for every variable
+# number seen so far, by any program. A process that parses many unrelated
+# programs with different variable numbers makes every call's frame larger,
+# so unrelated programs are better run in separate processes.
+_NUMBERS = [0]
+_NUMBER_SLOTS = {0: 0}
+
 
 class NumpadError(Exception):
     """Error that is caught by an issue in numpad code, not Python code.
@@ -32,73 +105,187 @@ class NumpadError(Exception):
     """
 
 
+def to_slot(variable_name):
+    """Convert a variable name to the int slot it is stored under.
+
+    Parameters:
+        variable_name : A str object of the variable's name.
+                      | REQ: The first character is '*'
+
+    Returns:
+        int slot for the variable, indexing the list of variables in each
+        Scope. *00 is slot 0.
+    """
+    assert variable_name and variable_name[0] == '*'
+
+    number = int(variable_name[1:])
+    if variable_name[1] == '0':
+        return _number_slot(-number)
+    return _number_slot(number)
+
+
+def _number_slot(number):
+    """Get the slot of a variable number, handing out a new one if needed.
+
+    Parameters:
+        number : int number of the variable, negated if its name starts
+               | with 0.
+    """
+    slot = _NUMBER_SLOTS.get(number)
+    if slot is None:
+        slot = _NUMBER_SLOTS[number] = len(_NUMBERS)
+        _NUMBERS.append(number)
+    return slot
+
+
+def to_name(slot):
+    """Convert an int slot back to its variable name.
+
+    Parameters:
+        slot : int slot, as returned by to_slot.
+
+    Returns:
+        str object of the variable's name.
+    """
+    number = _NUMBERS[slot]
+    if number <= 0:
+        return f"*0{-number}"
+    return f"*{number}"
+
+
+def param_slots(count):
+    """Get the slots of a function's first parameters.
+
+    Parameters:
+        count : int number of parameters.
+
+    Returns:
+        tuple of the int slots of *01, *02, and so on.
+    """
+    return tuple(_number_slot(-i) for i in range(1, count + 1))
+
+
+def new_frame():
+    """Create the list of variables held by a new scope.
+
+    Returns:
+        list with UNSET at every slot handed out so far, by any program
+        parsed in this process.
+    """
+    return [UNSET] * len(_NUMBERS)
+
+
+def _frame_names(variables):
+    """Map the name of each variable set in a list of variables to its value.
+    """
+    return {to_name(slot): value for slot, value in enumerate(variables)
+            if value is not UNSET}
+
+
 class Scope:
     """A level of variables and their associated values.
 
     Attributes:
         _parent    : Scope object appearing one level above.
-        _variables : dict of variables defined within this scope.
+        _variables : list of variables defined within this scope, indexed
+                   | by int slot. Slots it doesn't define hold UNSET.
     """
 
+    __slots__ = ('_parent', '_variables')
+
     def __init__(self, parent, variables=None):
         """Construct a new scope for keeping track of variables.
 
         Parameters:
             parent    : Scope object from which to inherit available variables.
-            variables : A dict containing variables that have already been
-                      | set.
-                      | DEFAULT: Empty dict.
+            variables : A list containing variables that have already been
+                      | set, as made by new_frame.
+                      | DEFAULT: A list from new_frame.
         """
         self._parent = parent
         if variables:
             self._variables = variables
         else:
-            self._variables = {}
+            self._variables = new_frame()
 
-    def get_value(self, variable_name):
-        """Get the value associated with the given variable name.
+    def _get_value_quiet(self, slot):
+        """Get the value associated with the given variable slot.
 
         Parameters:
-            variable_name : A str object of the variable's name.
-                          | REQ: The first character is '*'
+            slot : int slot of the variable, as returned by to_slot.
 
         Returns:
-            int or list associated with the given variable name.
+            int or list associated with the given variable.
 
-        If not found within this scope, will search parent scopes.
+        If not found within this scope, will search parent scopes, walking
+        up the chain in a loop rather than through recursion.
         """
-        assert variable_name and variable_name[0] == '*'
+        scope = self
+        while scope is not None:
+            variables = scope._variables
+            if slot < len(variables):
+                value = variables[slot]
+                if value is not UNSET:
+                    return value
+            scope = scope._parent
+        raise NumpadError(f"Variable {to_name(slot)} is not defined.")
+
+    def _get_value_verbose(self, slot):
+        """Print the variables of each scope searched for the given one."""
+        scope = self
+        while type(scope) == Scope:
+            variables = scope._variables
+            print(_frame_names(variables))
+            if slot < len(variables) and variables[slot] is not UNSET:
+                return variables[slot]
+            scope = scope._parent
+        return scope.get_value(slot)
+
+    get_value = _get_value_quiet
+
+    def find_frame(self, slot):
+        """Find the list of variables the given variable is read from.
 
-        if VERBOSE:
-            print(self._variables)
-
-        if variable_name in self._variables:
-            return self._variables[variable_name]
-        return self._parent.get_value(variable_name)
+        Parameters:
+            slot : int slot of the variable, as returned by to_slot.
 
-    def set_value(self, variable_name, value, indices=None):
+        Returns:
+            list of variables, from this scope or the nearest parent scope
+            that defines the variable.
+        """
+        scope = self
+        while scope is not None:
+            variables = scope._variables
+            if slot < len(variables) and variables[slot] is not UNSET:
+                return variables
+            scope = scope._parent
+        raise NumpadError(f"Variable {to_name(slot)} is not defined.")
+
+    def set_value(self, slot, value, indices=None):
         """Change one of the variables in this scope to the given value.
 
         Parameters:
-            variable_name : A str object of the variable's name.
-            value         : Expression object to be evaluated.
-            indices       : list of indices of the value to be modified,
-                          | assuming the variable is a list.
-                          | The first int is the index, and the following
-                          | are sub-indices.
+            slot    : int slot of the variable, as returned by to_slot.
+            value   : Expression object to be evaluated.
+            indices : list of int indices of the value to be modified,
+                    | assuming the variable is a list.
+                    | The first int is the index, and the following
+                    | are sub-indices.
         """
+        variables = self._variables
+        if slot >= len(variables):
+            variables.extend([UNSET] * (slot + 1 - len(variables)))
+
         if not indices:
-            self._variables[variable_name] = value
-        else:
-            to_change = self._variables[variable_name]
-            for i in indices[:-1]:
-                if isinstance(i, str):
-                    i = self.get_value(i)
-                to_change = to_change[i]
-            i = indices[-1]
-            if isinstance(i, str):
-                i = self.get_value(i)
-            to_change[i] = value
+            variables[slot] = value
+            return
+
+        to_change = variables[slot]
+        if to_change is UNSET:
+            raise NumpadError(f"Variable {to_name(slot)} is not defined.")
+        for i in indices[:-1]:
+            to_change = to_change[i]
+        to_change[indices[-1]] = value
 
     def parent(self):
         """Get the parent scope.
@@ -112,9 +299,9 @@ class Scope:
         """Create a new Scope with this object as its parent.
 
         Parameters:
-            variables : A dict containing variables that have already been
-                      | set.
-                      | DEFAULT: Empty dict.
+            variables : A list containing variables that have already been
+                      | set, as made by new_frame.
+                      | DEFAULT: A list from new_frame.
 
         Returns:
             Scope object with given variables and this object as a parent.
@@ -128,52 +315,94 @@ class NullScope(Scope):
     Does not need a parent scope.
 
     Attributes:
-        _variables : dict of variables defined within this scope.
+        _variables : list of variables defined within this scope.
 
     Inherits from Scope.
     """
 
+    __slots__ = ()
+
     def __init__(self, variables=None):
         """Construct a new scope for keeping track of variables."""
         super().__init__(None, variables)
 
-    def get_value(self, variable_name):
-        """Get the value associated with the given variable name.
+    def get_value(self, slot):
+        """Get the value associated with the given variable slot.
 
         Parameters:
-            variable_name : A str object of the variable's name.
-                          | REQ: The first character is '*'
+            slot : int slot of the variable, as returned by to_slot.
 
         Returns:
-            int or list associated with the given variable name.
+            int or list associated with the given variable.
 
         If not found within this scope, will raise "NOT FOUND" error.
         """
-        assert variable_name and variable_name[0] == '*'
-
-        if variable_name in self._variables:
-            return self._variables[variable_name]
+        variables = self._variables
+        if slot < len(variables) and variables[slot] is not UNSET:
+            return variables[slot]
 
-        raise NumpadError(f"Variable {variable_name} is not defined.")
+        raise NumpadError(f"Variable {to_name(slot)} is not defined.")
 
 
 class FuncExpression:
     """A function that can be called with provided parameters.
 
     Attributes:
-        _param : list of default parameter values.
-        _stmt  : StatementBlock object to potentially be run.
+        _defaults   : tuple of default parameter values.
+        _nparam     : int number of parameters declared.
+        _param_keys : tuple of the int slots the parameters are stored under,
+                    | *01, *02, and so on.
+        _first_key  : int slot of *01 if the parameters' slots are
+                    | consecutive, otherwise None.
+        _template   : list of variables a call starts from, holding 0 for
+                    | *00 and every default parameter value.
+        _scopes     : list of Scope objects left by finished calls, reused
+                    | by later calls.
+        _stmt       : StatementBlock object to potentially be run.
+        _code       : Python function compiled from _stmt by numpadgen, if
+                    | it has been compiled.
+        _memo       : dict mapping tuples of int arguments to int results,
+                    | or None if calls are not memoized.
+        _self_slot  : int slot the function calls itself through, which
+                    | must still hold this function for _memo to be used.
     """
 
-    def __init__(self, paramlist, block):
+    __slots__ = ('_defaults', '_nparam', '_param_keys', '_first_key',
+                 '_template', '_scopes', '_stmt', '_code', '_memo',
+                 '_self_slot')
+
+    def __init__(self, paramlist, block, code=None, pure=False,
+                 self_slot=None):
         """Construct a function with the given default parameters and block.
 
         Parameters:
             paramlist : list of default parameter values.
             block     : StatementBlock object to potentially be run.
+            code      : function compiled from block by
+                      | numpadgen.compile_block.
+                      | DEFAULT: None, meaning the block is walked directly.
+            pure      : bool, True if the result only depends on the
+                      | arguments, so calls can be memoized.
+                      | DEFAULT: False
+            self_slot : int slot a pure function reads itself through to
+                      | recurse.
+                      | DEFAULT: None, meaning it does not recurse.
         """
-        self._param = paramlist
+        self._defaults = tuple(paramlist)
+        self._nparam = len(paramlist)
+        self._param_keys = keys = param_slots(len(paramlist))
+        self._first_key = None
+        if keys and keys == tuple(range(keys[0], keys[0] + len(keys))):
+            self._first_key = keys[0]
+        self._template = new_frame()
+        self._template[0] = 0
+        for slot, value in zip(keys, self._defaults):
+            self._template[slot] = value
+        self._scopes = []
         self._stmt = block
+        self._code = code
+        self._memo = {} if pure else None
+        self._self_slot = self_slot
 
     def evaluate(self, _):
         """Return this object.
@@ -183,48 +412,146 @@ class FuncExpression:
         """
         return self
 
-    def run(self, scope, params=None):
+    def enter(self, scope, params):
+        """Create the child Scope a call to this function runs in.
+
+        Parameters:
+            scope  : Scope object containing available variables.
+            params : list of input parameter values.
+
+        Returns:
+            Scope object holding the parameters and a zeroed return value.
+
+        Missing parameters take their default values. The list passed in is
+        left unchanged. The new variables start as a copy of _template, so
+        only the parameters passed need to be set. The Scope itself is one
+        from _scopes when a finished call has left one.
+        """
+        count = len(params)
+        variables = self._template.copy()
+        first = self._first_key
+        if count > self._nparam:
+            keys = param_slots(count)
+            variables.extend([UNSET] * (len(_NUMBERS) - len(variables)))
+            for slot, value in zip(keys, params):
+                variables[slot] = value
+        elif first is not None:
+            variables[first:first + count] = params
+        else:
+            for slot, value in zip(self._param_keys, params):
+                variables[slot] = value
+        scopes = self._scopes
+        if not scopes:
+            return Scope(scope, variables)
+        child = scopes.pop()
+        child._parent = scope
+        child._variables = variables
+        return child
+
+    def run(self, scope, params=None, runner=None):
         """Create a new child Scope and runs the statment block.
 
         Parameters:
             scope  : Scope object containing available variables.
             params : list of input parameter values.
+            runner : numpadgen.Runner object to run the compiled block
+                   | with.
+                   | DEFAULT: None, meaning the block is walked directly.
+
+        Returns:
+            The final value of *00 within the function.
         """
-        params[len(params):] = self._param[len(params):]
-        child = scope.child(
-            {f"*0{str(i+1)}": val for i, val in enumerate(params)}
-        )
-        child.set_value("*00", 0)
-        self._stmt.run(child)
-        return child.get_value("*00")
+        key = self._memo_key(scope, params)
+        if key is not None and key in self._memo:
+            return self._memo[key]
+
+        child = self.enter(scope, params)
+        if runner is not None and self._code is not None:
+            runner.run(self._code, child)
+        else:
+            self._stmt.run(child)
+        value = child.get_value(0)
+        child._parent = child._variables = None
+        self._scopes.append(child)
+
+        if key is not None and value.__class__ is int:
+            self._memo[key] = value
+        return value
+
+    def _memo_key(self, scope, params):
+        """Get the key a call is memoized under.
+
+        Returns:
+            tuple of the arguments, or None if this call can't be memoized
+            because the function isn't pure, an argument isn't an int, or
+            the function's slot no longer holds it.
+        """
+        if self._memo is None:
+            return None
+        for val in params:
+            if val.__class__ is not int:
+                return None
+        if self._self_slot is not None:
+            try:
+                if scope.get_value(self._self_slot) is not self:
+                    return None
+            except NumpadError:
+                return None
+        return tuple(params)
 
 
 class Expression:
     """A simple expression containing a single piece of data.
 
     Attributes:
-        _value : Value of the expression.
-               | Either a string containing a number or variable name, or
-               | a list.
-        _type  : Either 'int', 'str', or 'list'.
-               | Determines how the expression should be evaluated.
+        _value       : Value of the expression.
+                     | Either an int, a variable name, or a list of
+                     | Expressions.
+        _kind        : Either EXPR_INT, EXPR_SLOT, or EXPR_LIST.
+                     | Determines how the expression should be evaluated.
+        _slot        : int slot of the variable, when _kind is EXPR_SLOT.
+        _cache_from  : list of variables of the scope the variable was last
+                     | looked up from, when it wasn't set there.
+        _cache_frame : list of variables the variable was found in then.
+
+    Unless VERBOSE is set when it is constructed, each Expression binds its
+    kind's function from _EVAL as its own evaluate method, so evaluating it
+    never has to check its kind. Otherwise it binds _evaluate_verbose.
+
+    While a scope is running, the scopes above it are waiting on calls and
+    can't change which variables they define. So a variable found in a
+    parent scope is found in the same list of variables every time, until
+    the current scope sets it itself.
     """
 
+    __slots__ = ('_value', '_kind', '_slot', '_cache_from', '_cache_frame',
+                 'evaluate')
+
     def __init__(self, value):
         """Construct a simple Expression object.
 
         Parameters:
-            value  : Either a string containing a number or variable name, or
-                   | a list.
+            value  : Either an int, a string containing a number or variable
+                   | name, or a list.
         """
         self._value = value
-        self._type = type(value)
 
-        if self._type == str and self._value[0] != '*':
-            self._value = int(self._value)
-            self._type = int
+        if type(value) == list:
+            self._kind = EXPR_LIST
+        elif type(value) == int or value[0] != '*':
+            self._value = int(value)
+            self._kind = EXPR_INT
+        else:
+            self._slot = to_slot(value)
+            self._kind = EXPR_SLOT
+        self._cache_from = self._cache_frame = None
 
-    def evaluate(self, scope):
+        if VERBOSE:
+            self.evaluate = self._evaluate_verbose
+        else:
+            self.evaluate = _EVAL[self._kind].__get__(self, Expression)
+
+    def _evaluate_quiet(self, scope):
         """Provide the evaluated value of this Expression.
 
         Parameters:
@@ -234,24 +561,182 @@ class Expression:
             Either a list or an integer, depending on what was provided. Will
             resolve variables to their values.
         """
-        if self._type == str:
-            value = scope.get_value(self._value)
-        elif self._type == list:
-            value = [ele.evaluate(scope) for ele in self._value]
+        return _EVAL[self._kind](self, scope)
+
+    def _evaluate_verbose(self, scope):
+        """Provide the evaluated value of this Expression, printing it."""
+        if self._kind == EXPR_SLOT:
+            value = scope.get_value(self._slot)
         else:
-            value = self._value
-        if VERBOSE:
-            print("Expression:", self._value, "->", value)
+            value = _EVAL[self._kind](self, scope)
+        print("Expression:", self._value, "->", value)
         return value
 
+    @property
+    def is_const(self):
+        """bool, True if this is an int or a list of only constants."""
+        if self._kind == EXPR_LIST:
+            return all(type(ele) == Expression and ele.is_const
+                       for ele in self._value)
+        return self._kind == EXPR_INT
+
+    def simplify(self):
+        """Fold any constant operations among the elements of a list.
+
+        Returns:
+            This Expression object.
+        """
+        if self._kind == EXPR_LIST:
+            self._value = [ele.simplify() for ele in self._value]
+        return self
+
+    def __reduce__(self):
+        """Pickle the Expression as the value it was constructed from.
+
+        Variables are stored by name rather than slot, since slots are only
+        handed out for the life of the process.
+        """
+        if self._kind == EXPR_SLOT:
+            return Expression, (to_name(self._slot),)
+        return Expression, (self._value,)
+
+    def prepare(self, scope):
+        """Look up where any variables in this Expression will be read from.
+
+        Fills the cache _eval_slot would fill on its first evaluation, so a
+        loop can resolve its condition's variables once before it starts.
+        Variables that aren't defined anywhere are left for evaluate to
+        report.
+
+        Parameters:
+            scope : Scope object the Expression is about to be evaluated in.
+        """
+        if self._kind == EXPR_SLOT:
+            variables = scope._variables
+            if self._slot < len(variables) \
+                    and variables[self._slot] is not UNSET:
+                return
+            try:
+                self._cache_frame = scope.find_frame(self._slot)
+            except NumpadError:
+                return
+            self._cache_from = variables
+        elif self._kind == EXPR_LIST:
+            for ele in self._value:
+                ele.prepare(scope)
+
+
+def _eval_int(self, scope):
+    """Evaluate an int Expression to its value."""
+    return self._value
+
+
+def _eval_slot(self, scope):
+    """Evaluate a variable Expression, checking the current scope first.
+
+    Variables set in a parent scope are read from the list of variables they
+    were found in last time, if the lookup is from the same scope.
+    """
+    variables = scope._variables
+    try:
+        value = variables[self._slot]
+    except IndexError:
+        return scope.get_value(self._slot)
+    if value is not UNSET:
+        return value
+    if self._cache_from is not variables:
+        self._cache_frame = scope.find_frame(self._slot)
+        self._cache_from = variables
+    return self._cache_frame[self._slot]
+
+
+def _eval_list(self, scope):
+    """Evaluate a list Expression to a new list of its elements' values."""
+    return [ele.evaluate(scope) for ele in self._value]
+
+
+_EVAL = (_eval_int, _eval_slot, _eval_list)
+
+
+def _const_value(expr):
+    """Get the value of a constant Expression without a Scope."""
+    if expr._kind == EXPR_LIST:
+        return [_const_value(ele) for ele in expr._value]
+    return expr._value
+
+
+def _const_expression(value):
+    """Build an Expression giving the value, or None if there isn't one.
+
+    A list value becomes a list Expression, so that each evaluation still
+    gives a new list.
+    """
+    if type(value) == int:
+        return Expression(value)
+    if type(value) != list:
+        return None
+    elements = [_const_expression(ele) for ele in value]
+    if None in elements:
+        return None
+    return Expression(elements)
+
+
+def _eq_int(x, y):
+    """Compare two values for equality, giving 1 or 0."""
+    return int(x == y)
+
+
+def _gt_int(x, y):
+    """Check whether x is greater than y, giving 1 or 0."""
+    return int(x > y)
+
+
+def _lt_int(x, y):
+    """Check whether x is less than y, giving 1 or 0."""
+    return int(x < y)
+
+
+def _divide_int_int(x, y):
+    """Divide two ints, giving the decimal result as a list.
+
+    Returns:
+        list of the quotient, scaled up by 10 for each decimal place kept,
+        and its exponent. At most 10 decimal places are kept, and the
+        quotient is rounded toward 0.
+
+    Only int arithmetic is used, so large operands never overflow or lose
+    digits to a float. Log still goes through OperExpression._float_to_list,
+    so its results keep only a float's 15 to 17 significant digits.
+    """
+    num, den = abs(x), abs(y)
+    power = 0
+    while num % den and power > -10:
+        num *= 10
+        power -= 1
+    if (x < 0) != (y < 0):
+        return [-(num // den), power]
+    return [num // den, power]
+
+
+def _log_int_int(x, y):
+    """Take the log of x in base y, giving the decimal result as a list."""
+    return OperExpression._float_to_list(log(x) / log(y))
+
 
 class OperExpression:
     """Expression representing some operation between two other expressions.
 
     Attributes:
-        _l     : Expression object on the left side.
-        _op    : str object representing some operation.
-        _r     : Expression object on the right side.
+        _l        : Expression object on the left side.
+        _op       : str object representing some operation.
+        _op_id    : int id of the operation, indexing DISPATCH.
+        _r        : Expression object on the right side.
+        _cache_l  : Class of the left value the last time it was evaluated.
+        _cache_r  : Class of the right value the last time it was evaluated.
+        _cache_fn : Callable from DISPATCH used for those classes.
+
+    Evaluating with values of the same classes as last time calls _cache_fn
+    without looking anything up. Function calls aren't cached.
     """
 
     @staticmethod
@@ -268,25 +753,33 @@ class OperExpression:
 
         To transform back into a float, multiply the first element by 10 to
         the power of the second element.
+
+        The digits are those of the shortest decimal that reads back as the
+        same float, taken from its repr in one step rather than by
+        repeatedly multiplying by 10, which adds rounding error each time.
         """
-        power = 0
-        while dec % 1 and power < 10:
-            power -= 1
-            dec *= 10
-        return [int(dec), power]
+        if dec.is_integer():
+            return [int(dec), 0]
+        text = repr(dec)
+        if 'e' in text:
+            sign, digits, power = Decimal(text).as_tuple()
+            value = int(''.join(map(str, digits)))
+            return [-value if sign else value, power]
+        whole, _, fraction = text.partition('.')
+        return [int(whole + fraction), -len(fraction)]
 
     oper_int_int = {
-        '..': lambda x, y: int(x == y),
-        '.+': lambda x, y: int(x > y),
-        '.-': lambda x, y: int(x < y),
-        '+': lambda x, y: x + y,
-        '-': lambda x, y: x - y,
-        '*': lambda x, y: x * y,
-        '/': lambda x, y: OperExpression._float_to_list(x / y),
-        '*+': lambda x, y: x ** y,
-        '*-': lambda x, y: OperExpression._float_to_list(log(x) / log(y)),
-        '/+': lambda x, y: x % y,
-        '/-': lambda x, y: x // y
+        '..': _eq_int,
+        '.+': _gt_int,
+        '.-': _lt_int,
+        '+': add,
+        '-': sub,
+        '*': mul,
+        '/': _divide_int_int,
+        '*+': pow,
+        '*-': _log_int_int,
+        '/+': mod,
+        '/-': floordiv
     }
 
     oper_list_int = {
@@ -316,6 +809,9 @@ class OperExpression:
         '/-': lambda x, y: int(all(i in y for i in x))
     }
 
+    __slots__ = ('_l', '_r', '_op', '_op_id', '_cache_l', '_cache_r',
+                 '_cache_fn')
+
     def __init__(self, expr_l, oper, expr_r):
         """Construct an operator expression.
 
@@ -326,8 +822,10 @@ class OperExpression:
         """
         self._l, self._r = expr_l, expr_r
         self._op = oper
+        self._op_id = OP_IDS[oper]
+        self._cache_l = self._cache_r = self._cache_fn = None
 
-    def evaluate(self, scope):
+    def _evaluate_quiet(self, scope):
         """Provide the evaluated value of this Expression.
 
         Parameters:
@@ -339,63 +837,215 @@ class OperExpression:
         """
         val_l = self._l.evaluate(scope)
         val_r = self._r.evaluate(scope)
+        class_l = val_l.__class__
+        class_r = val_r.__class__
+        if class_l is self._cache_l and class_r is self._cache_r:
+            return self._cache_fn(val_l, val_r)
+
+        tid = _TYPE_PAIR.get((class_l, class_r), OTHER_TYPES)
+        if tid == FUNC_LIST and self._op == '-':
+            return val_l.run(scope, val_r)
+        function = DISPATCH[self._op_id][tid]
+        self._cache_l, self._cache_r = class_l, class_r
+        self._cache_fn = function
+        return function(val_l, val_r)
+
+    def _apply(self, scope, val_l, val_r):
+        """Apply the operation to already-evaluated values of any type.
+
+        Used by the int-specialized subclasses when a side isn't an int.
+        """
+        tid = _TYPE_PAIR.get((val_l.__class__, val_r.__class__), OTHER_TYPES)
+        if tid == FUNC_LIST and self._op == '-':
+            return val_l.run(scope, val_r)
+        return DISPATCH[self._op_id][tid](val_l, val_r)
 
-        type_l = type(val_l)
-        type_r = type(val_r)
-
-        if type_l == int and type_r == int:
-            operation = OperExpression.oper_int_int[self._op]
-            value = operation(val_l, val_r)
-            if VERBOSE:
-                print("OperExpression:", val_l, self._op, val_r, "->", value)
-            return value
+    def _evaluate_verbose(self, scope):
+        """Provide the evaluated value of this Expression, printing it."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
 
-        if type_l == FuncExpression and type_r == list:
-            if self._op != '-':
-                raise NumpadError(
-                    f"'{self._op}' operation not supported for func and list."
-                )
+        tid = _TYPE_PAIR.get((val_l.__class__, val_r.__class__), OTHER_TYPES)
+        if tid == FUNC_LIST and self._op == '-':
             value = val_l.run(scope, val_r)
-            if VERBOSE:
-                print("Function call:", val_l, val_r, "->", value)
+            print("Function call:", val_l, val_r, "->", value)
             return value
 
-        if type_l == list and type_r == int:
-            if self._op not in OperExpression.oper_list_int:
-                raise NumpadError(
-                    f"'{self._op}' not supported between list and int."
-                )
-            operation = OperExpression.oper_list_int[self._op]
-            value = operation(val_l, val_r)
-            if VERBOSE:
-                print("OperExpression:", val_l, self._op, val_r, "->", value)
-            return value
+        value = DISPATCH[self._op_id][tid](val_l, val_r)
+        print("OperExpression:", val_l, self._op, val_r, "->", value)
+        return value
 
-        if type_l == int and type_r == list:
-            if self._op not in OperExpression.oper_int_list:
-                raise NumpadError(
-                    f"'{self._op}' not supported between int and list."
-                )
-            operation = OperExpression.oper_int_list[self._op]
-            value = operation(val_l, val_r)
-            if VERBOSE:
-                print("OperExpression:", val_l, self._op, val_r, "->", value)
-            return value
+    evaluate = _evaluate_quiet
 
-        if type_l == list and type_r == list:
-            if self._op not in OperExpression.oper_list_list:
-                raise NumpadError(
-                    f"'{self._op}' not supported between list and list."
-                )
-            operation = OperExpression.oper_list_list[self._op]
-            value = operation(val_l, val_r)
-            if VERBOSE:
-                print("OperExpression:", val_l, self._op, val_r, "->", value)
-            return value
+    def simplify(self):
+        """Fold this operation into a single Expression if it is constant.
 
-        raise NumpadError(
-            "Operations between these types are not yet supported."
-        )
+        Returns:
+            Expression object holding the result if both sides are
+            constants, otherwise this object with its sides simplified.
+
+        Operations that would fail or give something other than an int or a
+        list are left to fail or give it when run, as are powers whose result
+        would be larger than FOLD_MAX_BITS. Arithmetic between sides that
+        look like ints is specialized to an _INT_OPERS class.
+        """
+        self._l = self._l.simplify()
+        self._r = self._r.simplify()
+        if not (type(self._l) == Expression and self._l.is_const
+                and type(self._r) == Expression and self._r.is_const):
+            if self._op in _INT_OPERS and not VERBOSE \
+                    and _int_like(self._l) and _int_like(self._r):
+                self.__class__ = _INT_OPERS[self._op]
+            return self
+
+        val_l, val_r = _const_value(self._l), _const_value(self._r)
+        if self._op == '*+' and type(val_l) == int and type(val_r) == int \
+                and val_l.bit_length() * val_r > FOLD_MAX_BITS:
+            return self
+        try:
+            value = OperExpression.operate(self._op, val_l, val_r)
+        except Exception:
+            return self
+        return _const_expression(value) or self
+
+    def prepare(self, scope):
+        """Look up where the variables on both sides will be read from."""
+        self._l.prepare(scope)
+        self._r.prepare(scope)
+
+    def __reduce__(self):
+        """Pickle the operation as a plain OperExpression.
+
+        Simplifying it again after unpickling picks the same int subclass.
+        """
+        return OperExpression, (self._l, self._op, self._r)
+
+    @staticmethod
+    def operate(oper, val_l, val_r):
+        """Apply an operation to two already-evaluated values.
+
+        Parameters:
+            oper  : str object representing some operation.
+            val_l : Value on the left side.
+            val_r : Value on the right side.
+
+        Returns:
+            Either a list or an integer, depending on the operation.
+
+        Function calls are not handled here, since they need a Scope.
+        """
+        return OperExpression.operate_id(OP_IDS[oper], val_l, val_r)
+
+    @staticmethod
+    def operate_id(op_id, val_l, val_r):
+        """Apply an operation, given by its id in OP_IDS, to two values.
+
+        Like operate, without looking the operation's symbol up.
+        """
+        tid = _TYPE_PAIR.get((val_l.__class__, val_r.__class__), OTHER_TYPES)
+        return DISPATCH[op_id][tid](val_l, val_r)
+
+
+class _IntAddExpression(OperExpression):
+    """OperExpression adding two ints, falling back to _apply otherwise."""
+
+    __slots__ = ()
+
+    def evaluate(self, scope):
+        """Provide the evaluated value of this Expression."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
+        if val_l.__class__ is int and val_r.__class__ is int:
+            return val_l + val_r
+        return self._apply(scope, val_l, val_r)
+
+
+class _IntSubExpression(OperExpression):
+    """OperExpression subtracting two ints, falling back to _apply otherwise.
+    """
+
+    __slots__ = ()
+
+    def evaluate(self, scope):
+        """Provide the evaluated value of this Expression."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
+        if val_l.__class__ is int and val_r.__class__ is int:
+            return val_l - val_r
+        return self._apply(scope, val_l, val_r)
+
+
+class _IntMulExpression(OperExpression):
+    """OperExpression multiplying two ints, falling back to _apply otherwise.
+    """
+
+    __slots__ = ()
+
+    def evaluate(self, scope):
+        """Provide the evaluated value of this Expression."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
+        if val_l.__class__ is int and val_r.__class__ is int:
+            return val_l * val_r
+        return self._apply(scope, val_l, val_r)
+
+
+class _IntModExpression(OperExpression):
+    """OperExpression taking the modulo of two ints, falling back to _apply
+    otherwise.
+    """
+
+    __slots__ = ()
+
+    def evaluate(self, scope):
+        """Provide the evaluated value of this Expression."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
+        if val_l.__class__ is int and val_r.__class__ is int:
+            return val_l % val_r
+        return self._apply(scope, val_l, val_r)
+
+
+class _IntFloorDivExpression(OperExpression):
+    """OperExpression floor dividing two ints, falling back to _apply
+    otherwise.
+    """
+
+    __slots__ = ()
+
+    def evaluate(self, scope):
+        """Provide the evaluated value of this Expression."""
+        val_l = self._l.evaluate(scope)
+        val_r = self._r.evaluate(scope)
+        if val_l.__class__ is int and val_r.__class__ is int:
+            return val_l // val_r
+        return self._apply(scope, val_l, val_r)
+
+
+# Operations whose OperExpressions are specialized when both sides look like
+# ints, and the classes they become.
+_INT_OPERS = {
+    '+': _IntAddExpression,
+    '-': _IntSubExpression,
+    '*': _IntMulExpression,
+    '/+': _IntModExpression,
+    '/-': _IntFloorDivExpression
+}
+
+# Operations giving an int when both sides are ints.
+_INT_RESULT_OPS = frozenset(('..', '.+', '.-', '+', '-', '*', '/+', '/-'))
+
+
+def _int_like(expr):
+    """Guess whether an expression will usually evaluate to an int.
+
+    Ints and variables count, as do operations giving ints between sides
+    that count. Specialized classes check the actual values anyway.
+    """
+    if isinstance(expr, OperExpression):
+        return expr._op in _INT_RESULT_OPS and _int_like(expr._l) \
+            and _int_like(expr._r)
+    return type(expr) == Expression and expr._kind != EXPR_LIST
 
 
 class StatementBlock:
@@ -403,80 +1053,190 @@ class StatementBlock:
 
     Attributes:
         _stmts : list of objects that all start with 'Statement'.
+        _runs  : tuple of the run method of each statement, as of the last
+               | call to finalize.
+        run    : Callable running the block, chosen by finalize.
+
+    Blocks of one to three statements call their statements' run methods
+    directly rather than looping over them, and longer blocks loop over
+    _runs. These are the run methods chosen when the block is finalized,
+    so set_verbose should be called before the program is parsed.
     """
 
+    __slots__ = ('_stmts', '_runs', 'run')
+
     def __init__(self):
         """Create a block of statements that starts empty."""
         self._stmts = []
+        self._runs = ()
+        self.run = self._run_loop
 
     def append(self, stmt):
-        """Add another statement to the block."""
+        """Add another statement to the block.
+
+        The block runs by looping over its statements until finalize is
+        called again.
+        """
         self._stmts.append(stmt)
+        self.run = self._run_loop
 
-    def run(self, scope):
+    def finalize(self):
+        """Pick the version of run suited to the number of statements.
+
+        Called by the parser once the block is closed, and again whenever
+        the block is simplified.
+        """
+        runs = self._runs = tuple(stmt.run for stmt in self._stmts)
+        count = len(runs)
+        if count > 3 or not count:
+            self.run = self._run_runs
+        elif count == 1:
+            self.run = runs[0]
+        elif count == 2:
+            run_1, run_2 = runs
+
+            def _run2(scope):
+                run_1(scope)
+                run_2(scope)
+
+            self.run = _run2
+        else:
+            run_1, run_2, run_3 = runs
+
+            def _run3(scope):
+                run_1(scope)
+                run_2(scope)
+                run_3(scope)
+
+            self.run = _run3
+
+    def _run_loop(self, scope):
         """Run all statements in this block in order."""
         for stmt in self._stmts:
             stmt.run(scope)
 
+    def _run_runs(self, scope):
+        """Run all statements in this block through the methods in _runs."""
+        for run in self._runs:
+            run(scope)
+
+    def simplify(self):
+        """Fold constant operations in every statement of the block."""
+        for stmt in self._stmts:
+            stmt.simplify()
+        self.finalize()
+
+    def __reduce__(self):
+        """Pickle the block as its statements, appended one by one.
+
+        An unpickled block runs by looping over its statements until it is
+        finalized.
+        """
+        return StatementBlock, (), None, iter(self._stmts)
+
 
 class StatementSet:
     """Statement that sets the value of a variable to an expression's value.
 
     Attributes:
-        _variable : str representation of the variable being changed.
-        _r        : Expression object on the right side.
+        _slot : int slot of the variable being changed.
+        _r    : Expression object on the right side.
     """
 
+    __slots__ = ('_slot', '_r')
+
     def __init__(self, number, expr):
         """Construct a statement that will set a variable's value.
 
         Parameters:
             number : int representing the variable to be set.
+                   | 0 sets the return value, *00.
             expr   : Expression object to be evaluated.
         """
-        self._variable = f"*{str(number)}"
+        self._slot = _number_slot(number)
         self._r = expr
 
-    def run(self, scope):
+    def __reduce__(self):
+        """Pickle the statement by its variable's number and expression."""
+        return StatementSet, (_NUMBERS[self._slot], self._r)
+
+    def simplify(self):
+        """Fold constant operations in the expression."""
+        self._r = self._r.simplify()
+
+    def _run_quiet(self, scope):
         """Evaluate the variable's value to the evaluated expression.
 
         Paramters:
             scope : Scope object containing available variables.
         """
+        scope.set_value(self._slot, self._r.evaluate(scope))
+
+    def _run_verbose(self, scope):
+        """Evaluate the variable's value, printing the new value."""
         value = self._r.evaluate(scope)
-        scope.set_value(self._variable, value)
-        if VERBOSE:
-            print("Set", self._variable, "to", value)
+        scope.set_value(self._slot, value)
+        print("Set", to_name(self._slot), "to", value)
+
+    run = _run_quiet
 
 
 class StatementSetIndex:
     """Statement that sets the value of a variable to an expression's value.
 
     Attributes:
-        _variable : str representation of the variable being changed.
-        _indices  : list of index and sub-indices
-        _r        : Expression object on the right side.
+        _slot    : int slot of the variable being changed.
+        _indices : list of Expression objects for the index and sub-indices.
+        _r       : Expression object on the right side.
+        _store   : Bound method changing the list, specialized to the number
+                 | of indices.
     """
 
+    __slots__ = ('_slot', '_indices', '_r', '_store')
+
     def __init__(self, number, indices):
         """Construct a statement that will set a variable's value.
 
         Parameters:
-            number : int representing the variable to be set.
-            expr   : int representing index of the list to be modified.
+            number  : int representing the variable to be set.
+            indices : list holding the Expression object for the index of
+                    | the list to be modified.
         """
-        self._variable = f"*{str(number)}"
+        self._slot = _number_slot(number)
         self._indices = indices
         self._r = None
+        self._choose_store()
+
+    def _choose_store(self):
+        """Pick the version of _store suited to the number of indices."""
+        count = len(self._indices)
+        if count == 1:
+            self._store = self._store_one
+        elif count == 2:
+            self._store = self._store_two
+        else:
+            self._store = self._store_many
 
     def add_sub_index(self, index):
         """Add a sub-index to be set (for lists of lists).
 
         Parameters:
-            index : int of the index to be modified.
+            index : Expression object of the index to be modified.
                   | Index of the list at the last index provided.
         """
         self._indices.append(index)
+        self._choose_store()
+
+    def __reduce__(self):
+        """Pickle the statement by its variable's number, indices and
+        expression.
+        """
+        return (StatementSetIndex, (_NUMBERS[self._slot], list(self._indices)),
+                self._r)
+
+    def __setstate__(self, expr):
+        """Set the expression of an unpickled statement."""
+        self.set_expr(expr)
 
     def set_expr(self, expr):
         """Set the expression to be evaluated and sent to the list.
@@ -486,30 +1246,84 @@ class StatementSetIndex:
         """
         self._r = expr
 
-    def run(self, scope):
+    def simplify(self):
+        """Fold constant operations in the indices and expression."""
+        self._indices = [index.simplify() for index in self._indices]
+        self._r = self._r.simplify()
+        self._choose_store()
+
+    def _run_quiet(self, scope):
         """Evaluate the variable's value to the evaluated expression.
 
         Paramters:
             scope : Scope object containing available variables.
         """
+        self._store(scope)
+
+    def _target(self, scope):
+        """Get the list held by the variable in the current scope."""
+        variables = scope._variables
+        slot = self._slot
+        if slot < len(variables) and variables[slot] is not UNSET:
+            return variables[slot]
+        raise NumpadError(f"Variable {to_name(slot)} is not defined.")
+
+    def _store_one(self, scope):
+        """Set an item of the list, for a single index."""
         value = self._r.evaluate(scope)
-        scope.set_value(self._variable, value, self._indices)
-        if VERBOSE:
-            print_ind = '[' + ']['.join(map(str, self._indices)) + ']'
-            print("Set", f"{self._variable}{print_ind}", "to", value)
+        index = self._indices[0].evaluate(scope)
+        self._target(scope)[index] = value
+
+    def _store_two(self, scope):
+        """Set an item of a list in the list, for an index and sub-index."""
+        value = self._r.evaluate(scope)
+        index = self._indices[0].evaluate(scope)
+        sub_index = self._indices[1].evaluate(scope)
+        self._target(scope)[index][sub_index] = value
+
+    def _store_many(self, scope):
+        """Set an item of the list, for any number of indices."""
+        value = self._r.evaluate(scope)
+        indices = [index.evaluate(scope) for index in self._indices]
+        scope.set_value(self._slot, value, indices)
+
+    def _run_verbose(self, scope):
+        """Evaluate the variable's value, printing the new value.
+
+        Indices are printed as written, and looked up without printing
+        them as expressions.
+        """
+        value = self._r.evaluate(scope)
+        indices = [
+            scope.get_value(index._slot) if index._kind == EXPR_SLOT
+            else index._value
+            for index in self._indices
+        ]
+        scope.set_value(self._slot, value, indices)
+        print_ind = '[' + ']['.join(
+            str(index._value) for index in self._indices
+        ) + ']'
+        print("Set", f"{to_name(self._slot)}{print_ind}", "to", value)
+
+    run = _run_quiet
 
 
 class StatementDef:
     """Statement that defines a function.
 
     Attributes:
-        _variable : str representation of the variable being changed.
-        _params   : list of default parameter values.
-        _stmt     : StatementBlock object to potentially be run.
+        _slot      : int slot of the variable being changed.
+        _params    : list of default parameter values.
+        _stmt      : StatementBlock object to potentially be run.
+        _pure      : bool, True if MEMOIZE is set and the function's result
+                   | only depends on its arguments.
+        _recursive : bool, True if the function reads its own slot.
 
     Note: This function acts as a variable.
     """
 
+    __slots__ = ('_slot', '_params', '_stmt', '_pure', '_recursive')
+
     def __init__(self, number, paramlist, block):
         """Construct a statement that defines a given function.
 
@@ -518,20 +1332,53 @@ class StatementDef:
             paramlist : list of default parameter values.
             block     : StatementBlock object to potentially be run.
         """
-        self._variable = f"*{str(number)}"
+        self._slot = _number_slot(number)
         self._params = paramlist
         self._stmt = block
+        self._pure, self._recursive = False, False
+        if MEMOIZE:
+            self._pure, self._recursive = _purity(self._slot, paramlist,
+                                                  block)
+
+    def __reduce__(self):
+        """Pickle the statement by its variable's number, parameters and
+        block.
+        """
+        return StatementDef, (_NUMBERS[self._slot], self._params, self._stmt)
+
+    def make_function(self, code=None):
+        """Create the function this statement defines.
+
+        Parameters:
+            code : function compiled from the block by
+                 | numpadgen.compile_block.
+                 | DEFAULT: None, meaning the block is walked directly.
+
+        Returns:
+            FuncExpression object.
+        """
+        self_slot = self._slot if self._recursive else None
+        return FuncExpression(self._params, self._stmt, code, self._pure,
+                              self_slot)
 
-    def run(self, scope):
+    def simplify(self):
+        """Fold constant operations in the function's block."""
+        self._stmt.simplify()
+
+    def _run_quiet(self, scope):
         """Evaluate the variable's value to the defined function.
 
         Parameters:
             scope : Scope object containing available variables.
         """
-        value = FuncExpression(self._params, self._stmt)
-        scope.set_value(self._variable, value)
-        if VERBOSE:
-            print("Defined function", self._variable)
+        scope.set_value(self._slot, self.make_function())
+
+    def _run_verbose(self, scope):
+        """Evaluate the variable's value to the defined function, printing."""
+        self._run_quiet(scope)
+        print("Defined function", to_name(self._slot))
+
+    run = _run_quiet
 
 
 class StatementIf:
@@ -541,8 +1388,13 @@ class StatementIf:
         _expr      : Expression object to be evaluated and checked.
         _stmt      : StatementBlock object to potentially be run.
         _else_stmt : StatementBlock object to be run if the expression fails.
+        _ev        : evaluate method of _expr.
+        _body      : run method of _stmt.
+        _else_body : run method of _else_stmt, or None.
     """
 
+    __slots__ = ('_expr', '_stmt', '_else_stmt', '_ev', '_body', '_else_body')
+
     def __init__(self, expression, block):
         """Construct a statement that only runs if expression isn't 0.
 
@@ -553,6 +1405,16 @@ class StatementIf:
         self._expr = expression
         self._stmt = block
         self._else_stmt = None
+        self._bind()
+
+    def _bind(self):
+        """Keep the methods run calls, so it doesn't look them up each time.
+
+        Must be called again whenever _expr, _stmt or _else_stmt changes.
+        """
+        self._ev = self._expr.evaluate
+        self._body = self._stmt.run
+        self._else_body = self._else_stmt.run if self._else_stmt else None
 
     def set_else(self, block):
         """Add an else statement to be run if the expression is 0.
@@ -561,36 +1423,301 @@ class StatementIf:
             block : StatementBlock object to potentially be run.
         """
         self._else_stmt = block
+        self._bind()
+
+    def __reduce__(self):
+        """Pickle the statement by its expression and blocks.
 
-    def run(self, scope):
+        Used by StatementWhile too, which never has an else block. Compiled
+        loop kernels are not kept.
+        """
+        return type(self), (self._expr, self._stmt), self._else_stmt
+
+    def __setstate__(self, block):
+        """Set the else block of an unpickled statement."""
+        self.set_else(block)
+
+    def simplify(self):
+        """Fold constant operations in the expression and blocks."""
+        self._expr = self._expr.simplify()
+        self._stmt.simplify()
+        if self._else_stmt:
+            self._else_stmt.simplify()
+        self._bind()
+
+    def _run_quiet(self, scope):
         """Evaluate the expression and run the block if not 0."""
-        value = self._expr.evaluate(scope)
-        if value:
-            if VERBOSE:
-                print("If statement passed")
+        if self._ev(scope):
+            self._body(scope)
+        elif self._else_body:
+            self._else_body(scope)
+
+    def _run_verbose(self, scope):
+        """Evaluate the expression and run the block if not 0, printing."""
+        if self._expr.evaluate(scope):
+            print("If statement passed")
             self._stmt.run(scope)
         else:
-            if VERBOSE:
-                print("If statement failed")
+            print("If statement failed")
             if self._else_stmt:
                 self._else_stmt.run(scope)
 
+    run = _run_quiet
+
 
 class StatementWhile(StatementIf):
     """Statement that runs its block as long as its expression doesn't equal 0.
 
     Attributes:
-        _expr  : Expression object to be evaluated and checked.
-        _stmt  : StatementBlock object to potentially be run.
+        _expr   : Expression object to be evaluated and checked.
+        _stmt   : StatementBlock object to potentially be run.
+        _kernel : numpadjit.LoopKernel object to run in place of walking the
+                | block, if the loop has been compiled.
+        _loop   : Bound method running the loop, specialized to the shape of
+                | _expr.
     """
 
-    def run(self, scope):
+    __slots__ = ('_kernel', '_loop')
+
+    def __init__(self, expression, block):
+        """Construct a statement that runs as long as expression isn't 0.
+
+        Parameters:
+            expression : Expression object to be evaluated and checked.
+            block      : StatementBlock object to potentially be run.
+        """
+        super().__init__(expression, block)
+        self._kernel = None
+        self._choose_loop()
+
+    def _choose_loop(self):
+        """Pick the version of the loop suited to the shape of _expr."""
+        expr = self._expr
+        if isinstance(expr, OperExpression) and expr._op in LOOP_COMPARISONS \
+                and type(expr._l) == Expression \
+                and expr._l._kind == EXPR_SLOT \
+                and type(expr._r) == Expression and expr._r._kind == EXPR_INT:
+            self._loop = self._loop_slot_const
+        else:
+            self._loop = self._loop_generic
+
+    def simplify(self):
+        """Fold constant operations, then pick the loop for the new shape."""
+        super().simplify()
+        self._choose_loop()
+
+    def set_kernel(self, kernel):
+        """Add a natively compiled version of this loop.
+
+        Parameters:
+            kernel : numpadjit.LoopKernel object compiled from this loop.
+        """
+        self._kernel = kernel
+
+    def _run_quiet(self, scope):
         """Evaluate the expression and run the block while not 0."""
-        value = self._expr.evaluate(scope)
-        while value:
-            if VERBOSE:
-                print("While statement continued")
+        if self._kernel and self._kernel.run(scope):
+            return
+        self._loop(scope)
+
+    def _loop_generic(self, scope):
+        """Run the loop, evaluating the expression before each iteration."""
+        self._expr.prepare(scope)
+        evaluate = self._ev
+        body = self._body
+        while evaluate(scope):
+            body(scope)
+
+    def _loop_slot_const(self, scope):
+        """Run the loop, for an expression comparing a variable to an int.
+
+        The comparison is made directly while the variable holds an int.
+        Otherwise, the rest of the loop is run by _loop_generic. A variable
+        only set in a parent scope is looked up there once, before the loop.
+        """
+        slot = self._expr._l._slot
+        const = self._expr._r._value
+        compare = LOOP_COMPARISONS[self._expr._op]
+        variables = scope._variables
+        if slot >= len(variables):
+            variables.extend([UNSET] * (slot + 1 - len(variables)))
+        frame = variables
+        if variables[slot] is UNSET:
+            frame = scope.find_frame(slot)
+        body = self._body
+        while True:
+            value = variables[slot]
+            if value is UNSET:
+                value = frame[slot]
+            if value.__class__ is not int:
+                self._loop_generic(scope)
+                return
+            if not compare(value, const):
+                return
+            body(scope)
+
+    def _run_verbose(self, scope):
+        """Evaluate the expression and run the block while not 0, printing."""
+        while self._expr.evaluate(scope):
+            print("While statement continued")
             self._stmt.run(scope)
-            value = self._expr.evaluate(scope)
-        if VERBOSE:
-            print("While statement ended")
+        print("While statement ended")
+
+    run = _run_quiet
+
+
+def _purity(slot, paramlist, block):
+    """Check whether a function's result only depends on its arguments.
+
+    Parameters:
+        slot      : int slot the function is defined under.
+        paramlist : list of default parameter values.
+        block     : StatementBlock object making up the function.
+
+    Returns:
+        tuple of two bools: whether the function is pure, and whether it
+        reads its own slot to recurse.
+
+    A function is pure if every variable it reads is a parameter, *00, its
+    own slot, or certain to have been set earlier in the function. Setting
+    list items or defining functions makes it impure. Since variables are
+    always set in the function's own scope, nothing else can leak out.
+    """
+    recursive = False
+
+    def expr_pure(expr, assigned):
+        nonlocal recursive
+        if isinstance(expr, OperExpression):
+            return expr_pure(expr._l, assigned) and \
+                expr_pure(expr._r, assigned)
+        if type(expr) != Expression:
+            return False
+        if expr._kind == EXPR_SLOT:
+            if expr._slot in assigned:
+                return True
+            if expr._slot == slot:
+                recursive = True
+                return True
+            return False
+        if expr._kind == EXPR_LIST:
+            return all(expr_pure(ele, assigned) for ele in expr._value)
+        return True
+
+    def block_pure(block, assigned):
+        """Check a block, adding the slots it sets for certain to assigned."""
+        for stmt in block._stmts:
+            kind = type(stmt)
+            if kind == StatementSet:
+                if not expr_pure(stmt._r, assigned):
+                    return False
+                assigned.add(stmt._slot)
+            elif kind == StatementWhile:
+                if not expr_pure(stmt._expr, assigned) or \
+                        not block_pure(stmt._stmt, set(assigned)):
+                    return False
+            elif kind == StatementIf:
+                if not expr_pure(stmt._expr, assigned):
+                    return False
+                then_assigned = set(assigned)
+                else_assigned = set(assigned)
+                if not block_pure(stmt._stmt, then_assigned):
+                    return False
+                if stmt._else_stmt and \
+                        not block_pure(stmt._else_stmt, else_assigned):
+                    return False
+                assigned &= then_assigned & else_assigned
+            else:
+                return False
+        return True
+
+    assigned = set(param_slots(len(paramlist)))
+    assigned.add(0)
+    return block_pure(block, assigned), recursive
+
+
+_TYPE_PAIR = {
+    (int, int): INT_INT,
+    (list, int): LIST_INT,
+    (list, list): LIST_LIST,
+    (FuncExpression, list): FUNC_LIST,
+    (int, list): INT_LIST
+}
+
+
+def _unsupported(message):
+    """Create an operation that always fails with the given message."""
+    def operation(val_l, val_r):
+        raise NumpadError(message)
+    return operation
+
+
+def _build_dispatch():
+    """Build the table of operations for every op id and type pair id.
+
+    Returns:
+        tuple indexed by op id, of tuples indexed by type pair id, of
+        callables taking the left and right values.
+    """
+    tables = {
+        INT_INT: OperExpression.oper_int_int,
+        LIST_INT: OperExpression.oper_list_int,
+        LIST_LIST: OperExpression.oper_list_list,
+        INT_LIST: OperExpression.oper_int_list
+    }
+    names = {
+        INT_INT: "int and int",
+        LIST_INT: "list and int",
+        LIST_LIST: "list and list",
+        INT_LIST: "int and list"
+    }
+
+    dispatch = []
+    for oper in OP_IDS:
+        row = [None] * (OTHER_TYPES + 1)
+        for tid, table in tables.items():
+            if oper in table:
+                row[tid] = table[oper]
+            else:
+                row[tid] = _unsupported(
+                    f"'{oper}' not supported between {names[tid]}."
+                )
+        # Calls are made by the caller, which has a Scope to run them in.
+        row[FUNC_LIST] = _unsupported(
+            f"'{oper}' operation not supported for func and list."
+        )
+        row[OTHER_TYPES] = _unsupported(
+            "Operations between these types are not yet supported."
+        )
+        dispatch.append(tuple(row))
+    return tuple(dispatch)
+
+
+DISPATCH = _build_dispatch()
+
+
+# Methods with a verbose version, swapped in by set_verbose.
+_VERBOSE_METHODS = (
+    (Scope, 'get_value'),
+    (OperExpression, 'evaluate'),
+    (StatementSet, 'run'),
+    (StatementSetIndex, 'run'),
+    (StatementDef, 'run'),
+    (StatementIf, 'run'),
+    (StatementWhile, 'run')
+)
+
+
+def set_verbose(verbose):
+    """Choose between the quiet and verbose versions of every method.
+
+    Parameters:
+        verbose : bool, True to print each step as the program runs.
+
+    The quiet versions are the default, so running a program never has to
+    check VERBOSE.
+    """
+    global VERBOSE
+    VERBOSE = verbose
+    for cls, name in _VERBOSE_METHODS:
+        variant = '_verbose' if verbose else '_quiet'
+        setattr(cls, name, getattr(cls, f"_{name}{variant}"))
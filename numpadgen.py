@@ -0,0 +1,415 @@
+"""Compilation of numpad programs to Python functions.
+
+Importing this module will provide the following classes and functions:
+    CompileError  : Error raised when a tree cannot be compiled.
+    Runner        : Runs generated functions as the bodies of numpad
+                  | functions.
+    compile_block : Compile a StatementBlock to a Python function taking a
+                  | Scope.
+
+The tree walker decides what to do next in Python code, once for every node
+it visits. Here each block is instead translated to Python source once, so
+CPython's own bytecode loop does that dispatch. Variables are written to the
+scope's list of variables directly. Operations between values known to be
+ints are written out as plain Python arithmetic, and anything else goes
+through the same OperExpression.operate as the tree.
+
+Variables certain to be set in the running scope, such as a function's
+parameters and anything assigned on every path so far, are read from its
+list directly. Scoping is dynamic, since a function sees its caller's
+variables, so any other read falls back to searching the parent scopes when
+the running scope doesn't hold it.
+
+Loops given a numpadjit kernel try it first, and only run as Python when it
+declines.
+"""
+
+import re
+from collections import Counter
+from functools import partial
+
+from numpad import (FuncExpression, Expression, OperExpression,
+                    StatementBlock, StatementSet, StatementSetIndex,
+                    StatementDef, StatementIf, StatementWhile,
+                    EXPR_INT, EXPR_SLOT, EXPR_LIST, OP_IDS, UNSET,
+                    param_slots)
+
+# Python operators for operations between two ints.
+INT_OPS = {
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    '/+': '%',
+    '/-': '//'
+}
+
+# Id of '-', which calls a function when given one and a list.
+CALL_ID = OP_IDS['-']
+
+# Python comparisons for operations that always give an int.
+INT_COMPARISONS = {
+    '..': '==',
+    '.+': '>',
+    '.-': '<'
+}
+
+# A variable read from or written to the scope's list in generated source.
+_VARIABLE = re.compile(r"\bV\[(\d+)\]")
+
+# Lines of generated source assigning a Python local.
+_LOCAL_ASSIGN = re.compile(r" *(v\d+) = (.*)")
+
+
+class CompileError(Exception):
+    """Error raised when a tree cannot be compiled.
+
+    The tree can still be run directly when this happens.
+    """
+
+
+class Runner:
+    """Runs generated functions as the bodies of numpad functions.
+
+    Passed to FuncExpression.run, so calls run the compiled body rather than
+    walking the tree.
+    """
+
+    @staticmethod
+    def run(code, scope):
+        """Run a function made by compile_block against the given scope."""
+        code(scope)
+
+
+RUNNER = Runner()
+
+
+def _operate(scope, op_id, val_l, val_r):
+    """Apply an operation between two values, calling functions compiled.
+
+    The operation is given by its id in numpad.OP_IDS.
+    """
+    if op_id == CALL_ID and val_l.__class__ is FuncExpression \
+            and val_r.__class__ is list:
+        return val_l.run(scope, val_r, RUNNER)
+    return OperExpression.operate_id(op_id, val_l, val_r)
+
+
+class _Source:
+    """Generates the Python source of a single block.
+
+    Attributes:
+        _lines    : list of str lines generated so far.
+        _consts   : list of values the source refers to as cN, for the
+                  | value at index N.
+        _assigned : set of int slots certain to be set in the running scope
+                  | at the point being generated.
+        _ints     : set of slots in _assigned certain to hold ints.
+        _probing  : bool, True if only _ints is wanted from this source, so
+                  | loop and function bodies are skipped.
+        _loops    : dict mapping each loop and the state it starts in to
+                  | the result of _loop_ints, shared with every probe.
+        _calls    : bool, True if source generated since it was last
+                  | cleared can run numpad code or look in other scopes.
+        _repeated : set of slots read more than once by the expressions of
+                  | the statement being generated.
+        _bound    : set of slots in _repeated already read into a local.
+    """
+
+    def __init__(self, assigned=(), ints=()):
+        """Start an empty function.
+
+        Parameters:
+            assigned : iterable of int slots set before the block runs.
+                     | DEFAULT: Empty tuple.
+            ints     : iterable of the slots in assigned holding ints.
+                     | DEFAULT: Empty tuple.
+        """
+        self._lines = ["    V = scope._variables"]
+        self._consts = []
+        self._assigned = set(assigned)
+        self._ints = set(ints)
+        self._probing = False
+        self._loops = {}
+        self._calls = False
+        self._repeated = set()
+        self._bound = set()
+
+    def build(self, block):
+        """Generate a function running a block.
+
+        Returns:
+            tuple of the str source defining `run`, and the list of values
+            it refers to as C.
+
+        UNSET, _operate and every constant are bound as default arguments
+        of `run`, so the body reads them as locals rather than globals.
+        """
+        self._block(block, 1)
+        defaults = ''.join(f", c{index}=C[{index}]"
+                           for index in range(len(self._consts)))
+        header = f"def run(scope, UNSET=UNSET, _operate=_operate{defaults}):"
+        return '\n'.join([header, *self._lines]) + '\n', self._consts
+
+    def _const(self, value):
+        """Get the source referring to a value that can't be written out."""
+        self._consts.append(value)
+        return f"c{len(self._consts) - 1}"
+
+    def _statement(self, *exprs):
+        """Start generating the expressions a statement evaluates together.
+
+        A variable read more than once among them is only read once, into
+        a local named after its slot, and later reads use that local. Calls
+        can't assign the caller's variables, so its value can't change in
+        between.
+        """
+        counts = Counter(slot for expr in exprs for slot in _reads(expr))
+        self._repeated = {slot for slot, count in counts.items() if count > 1}
+        self._bound = set()
+
+    def _is_int(self, expr):
+        """Check whether an expression certainly evaluates to an int."""
+        if isinstance(expr, OperExpression):
+            if expr._op in INT_COMPARISONS:
+                return True
+            return expr._op in INT_OPS and self._is_int(expr._l) \
+                and self._is_int(expr._r)
+        if type(expr) != Expression:
+            return False
+        if expr._kind == EXPR_SLOT:
+            return expr._slot in self._ints
+        return expr._kind == EXPR_INT
+
+    def _loop_ints(self, loop):
+        """Find the slots certain to hold ints each time a loop starts.
+
+        The body is run through probes until the set stops shrinking. Each
+        result is kept in _loops, so a nested loop is only worked out once
+        for each state it can start in, rather than again for every probe
+        of the loops around it.
+        """
+        key = (id(loop), frozenset(self._assigned), frozenset(self._ints))
+        if key not in self._loops:
+            ints = set(self._ints)
+            while True:
+                probe = _Source(self._assigned, ints)
+                probe._probing = True
+                probe._loops = self._loops
+                probe._block(loop._stmt, 1)
+                after = ints & probe._ints
+                if after == ints:
+                    break
+                ints = after
+            self._loops[key] = frozenset(ints)
+        return set(self._loops[key])
+
+    def _block(self, block, depth):
+        """Generate every statement of a StatementBlock."""
+        if type(block) != StatementBlock:
+            raise CompileError(f"Cannot compile {type(block).__name__}.")
+        if not block._stmts:
+            self._lines.append("    " * depth + "pass")
+        for stmt in block._stmts:
+            self._stmt(stmt, depth)
+
+    def _stmt(self, stmt, depth):
+        """Generate a single statement at the given indentation depth."""
+        indent = "    " * depth
+        kind = type(stmt)
+
+        if kind == StatementSet:
+            self._statement(stmt._r)
+            value = self._expr(stmt._r)
+            self._lines.append(f"{indent}V[{stmt._slot}] = {value}")
+            self._assigned.add(stmt._slot)
+            if self._is_int(stmt._r):
+                self._ints.add(stmt._slot)
+            else:
+                self._ints.discard(stmt._slot)
+
+        elif kind == StatementSetIndex:
+            self._statement(stmt._r, *stmt._indices)
+            value = self._expr(stmt._r)
+            indices = [self._expr(index) for index in stmt._indices]
+            if stmt._slot in self._assigned and len(indices) <= 2:
+                path = ''.join(f"[{index}]" for index in indices)
+                self._lines.append(f"{indent}V[{stmt._slot}]{path} = {value}")
+            else:
+                self._lines.append(
+                    f"{indent}scope.set_value({stmt._slot}, {value}, "
+                    f"[{', '.join(indices)}])"
+                )
+                self._calls = True
+
+        elif kind == StatementDef:
+            params = param_slots(len(stmt._params))
+            body = None
+            if not self._probing:
+                body = compile_block(stmt._stmt, (0, *params), (0,))
+            make = self._const(partial(stmt.make_function, body))
+            self._lines.append(f"{indent}V[{stmt._slot}] = {make}()")
+            self._assigned.add(stmt._slot)
+            self._ints.discard(stmt._slot)
+            self._calls = True
+
+        elif kind == StatementWhile:
+            self._ints = self._loop_ints(stmt)
+            if self._probing:
+                return
+            if stmt._kernel is not None:
+                kernel = self._const(stmt._kernel)
+                self._lines.append(f"{indent}if not {kernel}.run(scope):")
+                depth += 1
+                indent = "    " * depth
+            start, calls = len(self._lines), self._calls
+            self._calls = False
+            self._statement(stmt._expr)
+            self._lines.append(f"{indent}while {self._cond(stmt._expr)}:")
+            before = set(self._assigned), set(self._ints)
+            self._block(stmt._stmt, depth + 1)
+            self._assigned, self._ints = before
+            if not self._calls:
+                self._localize(start, indent)
+            self._calls = calls or self._calls or stmt._kernel is not None
+
+        elif kind == StatementIf:
+            self._statement(stmt._expr)
+            self._lines.append(f"{indent}if {self._cond(stmt._expr)}:")
+            before = set(self._assigned), set(self._ints)
+            self._block(stmt._stmt, depth + 1)
+            then_assigned, then_ints = self._assigned, self._ints
+            self._assigned, self._ints = before
+            if stmt._else_stmt:
+                self._lines.append(f"{indent}else:")
+                self._block(stmt._else_stmt, depth + 1)
+                self._assigned &= then_assigned
+            self._ints &= then_ints
+
+        else:
+            raise CompileError(f"Cannot compile {kind.__name__}.")
+
+    def _localize(self, start, indent):
+        """Keep the variables of a loop in Python locals while it runs.
+
+        Only used on loops that can't run numpad code or look in other
+        scopes, so nothing else reads the scope's list until the loop ends.
+        Slots certain to be set when the loop starts are read into locals
+        before it, and the ones it assigns are written back after it.
+
+        Parameters:
+            start  : int index in _lines of the loop's first line.
+            indent : str indentation of the loop's first line.
+        """
+        used = set()
+
+        def local(match):
+            slot = int(match.group(1))
+            if slot not in self._assigned:
+                return match.group(0)
+            used.add(slot)
+            return f"v{slot}"
+
+        lines, written = [], set()
+        for line in self._lines[start:]:
+            line = _VARIABLE.sub(local, line)
+            assign = _LOCAL_ASSIGN.fullmatch(line)
+            if assign and assign[1] == assign[2]:
+                continue
+            if assign:
+                written.add(assign[1])
+            lines.append(line)
+
+        self._lines[start:] = [
+            *(f"{indent}v{slot} = V[{slot}]" for slot in sorted(used)),
+            *lines,
+            *(f"{indent}V[{name[1:]}] = {name}" for name in sorted(written)
+              if int(name[1:]) in used)
+        ]
+
+    def _cond(self, expr):
+        """Generate a Python expression that is true when expr isn't 0."""
+        if isinstance(expr, OperExpression) and expr._op in INT_COMPARISONS \
+                and self._is_int(expr._l) and self._is_int(expr._r):
+            compare = INT_COMPARISONS[expr._op]
+            return f"{self._expr(expr._l)} {compare} {self._expr(expr._r)}"
+        return self._expr(expr)
+
+    def _expr(self, expr):
+        """Generate a Python expression giving the value of expr."""
+        kind = type(expr)
+
+        if issubclass(kind, OperExpression):
+            val_l = self._expr(expr._l)
+            val_r = self._expr(expr._r)
+            if self._is_int(expr._l) and self._is_int(expr._r):
+                if expr._op in INT_OPS:
+                    return f"({val_l} {INT_OPS[expr._op]} {val_r})"
+                if expr._op in INT_COMPARISONS:
+                    compare = INT_COMPARISONS[expr._op]
+                    return f"(1 if {val_l} {compare} {val_r} else 0)"
+            self._calls = True
+            return f"_operate(scope, {expr._op_id}, {val_l}, {val_r})"
+
+        if kind != Expression:
+            raise CompileError(f"Cannot compile {kind.__name__}.")
+
+        if expr._kind == EXPR_INT:
+            return repr(expr._value)
+        if expr._kind == EXPR_LIST:
+            elements = ', '.join(self._expr(ele) for ele in expr._value)
+            return f"[{elements}]"
+        slot = expr._slot
+        if slot in self._assigned:
+            read = f"V[{slot}]"
+        else:
+            self._calls = True
+            read = (f"(t if (t := V[{slot}]) is not UNSET "
+                    f"else scope.get_value({slot}))")
+        if slot not in self._repeated:
+            return read
+        if slot in self._bound:
+            return f"r{slot}"
+        self._bound.add(slot)
+        return f"(r{slot} := {read})"
+
+
+def _reads(expr):
+    """Get the slot of every variable read by an expression, in order."""
+    if isinstance(expr, OperExpression):
+        return _reads(expr._l) + _reads(expr._r)
+    if type(expr) != Expression or expr._kind == EXPR_INT:
+        return []
+    if expr._kind == EXPR_LIST:
+        return [slot for ele in expr._value for slot in _reads(ele)]
+    return [expr._slot]
+
+
+def compile_block(block, assigned=(0,), ints=(0,)):
+    """Compile a StatementBlock to a Python function taking a Scope.
+
+    Parameters:
+        block    : StatementBlock object to be compiled.
+        assigned : iterable of int slots certain to be set in the Scope
+                 | before the block runs.
+                 | DEFAULT: Only *00.
+        ints     : iterable of the slots in assigned holding ints.
+                 | DEFAULT: Only *00.
+
+    Returns:
+        function running the block against the Scope it is given, which
+        must have been made after the block was parsed.
+
+    Raises CompileError if the block contains an unknown node, or is nested
+    too deeply for Python to compile.
+    """
+    try:
+        source, consts = _Source(assigned, ints).build(block)
+        namespace = {
+            'C': consts,
+            'UNSET': UNSET,
+            '_operate': _operate
+        }
+        exec(compile(source, "<numpad>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError) as error:
+        raise CompileError(f"Cannot compile block: {error}") from error
+    return namespace['run']
@@ -0,0 +1,349 @@
+"""Native compilation of integer-only while loops with Numba.
+
+Importing this module will provide the following classes and functions:
+    LoopKernel   : A while loop compiled to native code over an array of the
+                 | variables it touches.
+    compile_loop : Compile a single StatementWhile to a LoopKernel.
+    jit_loops    : Attach a LoopKernel to every StatementWhile in a program
+                 | that only does integer arithmetic on variables.
+
+Numba is optional, and only imported the first time jit_loops is called,
+since importing it takes longer than running most programs. When it cannot
+be imported, jit_loops leaves programs untouched and every loop is run as
+usual.
+
+Kernels do their arithmetic on 64-bit ints. Where a result would not fit,
+the kernel stops and the loop is walked from the start instead, so results
+are the same as with Python ints, just slower.
+"""
+
+from array import array
+
+from numpad import (NumpadError, Expression, OperExpression, StatementBlock,
+                    StatementSet, StatementDef, StatementIf, StatementWhile,
+                    EXPR_INT, EXPR_SLOT)
+
+numba = None
+np = None
+
+# Comparisons, which map directly onto int64 comparisons in a kernel.
+KERNEL_OPS = {
+    '..': '==',
+    '.+': '>',
+    '.-': '<'
+}
+
+# Arithmetic, which is done by helpers that raise OverflowError rather than
+# wrap.
+CHECKED_OPS = {
+    '+': '_add',
+    '-': '_sub',
+    '*': '_mul',
+    '/+': '_mod',
+    '/-': '_floordiv'
+}
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# Compiled kernels, keyed by their generated source.
+_KERNELS = {}
+
+# Numba-compiled versions of the CHECKED_OPS helpers, made with the first
+# kernel.
+_HELPERS = {}
+
+
+def _add(a, b):
+    """Add two int64s, raising OverflowError if the sum doesn't fit."""
+    if (b > 0 and a > INT64_MAX - b) or (b < 0 and a < INT64_MIN - b):
+        raise OverflowError
+    return a + b
+
+
+def _sub(a, b):
+    """Subtract two int64s, raising OverflowError if the result doesn't
+    fit."""
+    if (b < 0 and a > INT64_MAX + b) or (b > 0 and a < INT64_MIN + b):
+        raise OverflowError
+    return a - b
+
+
+def _mul(a, b):
+    """Multiply two int64s, raising OverflowError if the product doesn't
+    fit.
+
+    Numba lets LLVM assume products don't wrap, so the check has to come
+    before multiplying rather than after.
+    """
+    if a == 0 or b == 0:
+        return 0
+    if a == -1 or b == -1:
+        if a == INT64_MIN or b == INT64_MIN:
+            raise OverflowError
+        return -b if a == -1 else -a
+    if a > 0:
+        if b > 0:
+            overflow = a > INT64_MAX // b
+        else:
+            overflow = a > INT64_MIN // b
+    elif b > 0:
+        overflow = b > INT64_MIN // a
+    else:
+        overflow = a == INT64_MIN or b == INT64_MIN \
+            or -a > INT64_MAX // -b
+    if overflow:
+        raise OverflowError
+    return a * b
+
+
+def _mod(a, b):
+    """Get the Python-style remainder of two int64s."""
+    if b == -1:
+        return 0
+    return a % b
+
+
+def _floordiv(a, b):
+    """Floor divide two int64s, raising OverflowError if the result doesn't
+    fit."""
+    if b == -1:
+        if a == INT64_MIN:
+            raise OverflowError
+        return -a
+    return a // b
+
+
+def _import_numba():
+    """Import Numba and NumPy if they haven't been already.
+
+    Returns:
+        bool, True if both are available.
+    """
+    global numba, np
+    if numba is None:
+        try:
+            import numba
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+class _Unsupported(Exception):
+    """Raised while generating a kernel for a loop that cannot be compiled."""
+
+
+class LoopKernel:
+    """A while loop compiled to native code over an array of the variables it
+    touches.
+
+    Attributes:
+        _slots   : tuple of int slots, in the order they appear in the array.
+        _read    : frozenset of slots the loop reads.
+        _func    : Numba-compiled function taking the value array and a
+                 | same-sized array flagging which slots were written.
+    """
+
+    def __init__(self, slots, read, func):
+        """Wrap a compiled loop.
+
+        Parameters:
+            slots : tuple of int slots, in the order they appear in the array.
+            read  : set of slots the loop may read.
+            func  : Numba-compiled function running the loop.
+        """
+        self._slots = slots
+        self._read = frozenset(read)
+        self._func = func
+
+    def run(self, scope):
+        """Run the loop natively if the current variables allow it.
+
+        Parameters:
+            scope : Scope object containing available variables.
+
+        Returns:
+            True if the loop was run, or False if some variable it reads is
+            undefined, not an int, or too large for 64 bits, or if the loop
+            fails or overflows part way. In that case nothing has been
+            changed and the loop should be walked instead.
+        """
+        values = []
+        for slot in self._slots:
+            try:
+                values.append(scope.get_value(slot))
+            except NumpadError:
+                if slot in self._read:
+                    return False
+                values.append(0)
+        try:
+            packed = array('q', values)
+        except (TypeError, OverflowError):
+            return False
+
+        written = np.zeros(len(self._slots), dtype=np.int64)
+        try:
+            self._func(np.frombuffer(packed, dtype=np.int64), written)
+        except ArithmeticError:
+            return False
+
+        for i, slot in enumerate(self._slots):
+            if written[i]:
+                scope.set_value(slot, packed[i])
+        return True
+
+
+class _KernelSource:
+    """Generates Python source for a loop, to be compiled by Numba.
+
+    Attributes:
+        _lines : list of str lines generated so far.
+        _slots : dict mapping each int slot to its index in the array.
+        _read  : set of slots read anywhere in the loop.
+    """
+
+    def __init__(self):
+        """Start an empty kernel."""
+        self._lines = ["def kernel(V, W):"]
+        self._slots = {}
+        self._read = set()
+
+    def build(self, loop):
+        """Generate the kernel for a StatementWhile.
+
+        Returns:
+            str of Python source defining `kernel`.
+
+        Raises _Unsupported if the loop does anything but int arithmetic on
+        variables.
+        """
+        self._stmt(loop, 1)
+        return '\n'.join(self._lines) + '\n'
+
+    def slots(self):
+        """Get the slots used by the kernel, in array order."""
+        return tuple(sorted(self._slots, key=self._slots.get))
+
+    def read(self):
+        """Get the slots read by the kernel."""
+        return set(self._read)
+
+    def _index(self, slot):
+        """Get the array index of a slot, adding it if needed."""
+        if slot not in self._slots:
+            self._slots[slot] = len(self._slots)
+        return self._slots[slot]
+
+    def _block(self, block, depth):
+        """Generate every statement of a StatementBlock."""
+        if type(block) != StatementBlock:
+            raise _Unsupported
+        for stmt in block._stmts:
+            self._stmt(stmt, depth)
+
+    def _stmt(self, stmt, depth):
+        """Generate a single statement at the given indentation depth."""
+        indent = "    " * depth
+        kind = type(stmt)
+
+        if kind == StatementSet:
+            index = self._index(stmt._slot)
+            self._lines.append(f"{indent}V[{index}] = {self._expr(stmt._r)}")
+            self._lines.append(f"{indent}W[{index}] = 1")
+
+        elif kind == StatementWhile:
+            self._lines.append(f"{indent}while {self._expr(stmt._expr)}:")
+            self._block(stmt._stmt, depth + 1)
+
+        elif kind == StatementIf:
+            self._lines.append(f"{indent}if {self._expr(stmt._expr)}:")
+            self._block(stmt._stmt, depth + 1)
+            if stmt._else_stmt:
+                self._lines.append(f"{indent}else:")
+                self._block(stmt._else_stmt, depth + 1)
+
+        else:
+            raise _Unsupported
+
+    def _expr(self, expr):
+        """Generate a Python expression computing an int."""
+        kind = type(expr)
+
+        if issubclass(kind, OperExpression):
+            if expr._op in KERNEL_OPS:
+                val_l = self._expr(expr._l)
+                val_r = self._expr(expr._r)
+                return f"int({val_l} {KERNEL_OPS[expr._op]} {val_r})"
+            if expr._op in CHECKED_OPS:
+                val_l = self._expr(expr._l)
+                val_r = self._expr(expr._r)
+                return f"{CHECKED_OPS[expr._op]}({val_l}, {val_r})"
+            raise _Unsupported
+
+        if kind == Expression and expr._kind == EXPR_INT:
+            if not INT64_MIN <= expr._value <= INT64_MAX:
+                raise _Unsupported
+            return str(expr._value)
+
+        if kind == Expression and expr._kind == EXPR_SLOT:
+            self._read.add(expr._slot)
+            return f"V[{self._index(expr._slot)}]"
+
+        raise _Unsupported
+
+
+def compile_loop(loop):
+    """Compile a single StatementWhile to a LoopKernel.
+
+    Parameters:
+        loop : StatementWhile object to be compiled.
+
+    Returns:
+        LoopKernel object, or None if the loop cannot be compiled.
+    """
+    source = _KernelSource()
+    try:
+        text = source.build(loop)
+    except _Unsupported:
+        return None
+
+    if not _HELPERS:
+        for name in CHECKED_OPS.values():
+            _HELPERS[name] = numba.njit(globals()[name])
+
+    if text not in _KERNELS:
+        namespace = dict(_HELPERS)
+        exec(text, namespace)
+        _KERNELS[text] = numba.njit(namespace['kernel'])
+
+    return LoopKernel(source.slots(), source.read(), _KERNELS[text])
+
+
+def jit_loops(block):
+    """Attach a LoopKernel to every eligible StatementWhile in a program.
+
+    Parameters:
+        block : StatementBlock object, usually a whole parsed program.
+
+    Loops inside function definitions and other statements are found too.
+    A loop that cannot be compiled is searched for inner loops that can.
+    Does nothing if Numba is not installed.
+    """
+    if not _import_numba():
+        return
+
+    for stmt in block._stmts:
+        kind = type(stmt)
+        if kind == StatementWhile:
+            kernel = compile_loop(stmt)
+            if kernel:
+                stmt.set_kernel(kernel)
+            else:
+                jit_loops(stmt._stmt)
+        elif kind == StatementIf:
+            jit_loops(stmt._stmt)
+            if stmt._else_stmt:
+                jit_loops(stmt._else_stmt)
+        elif kind == StatementDef:
+            jit_loops(stmt._stmt)
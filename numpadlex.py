@@ -1,4 +1,20 @@
-import ply.lex as lex
+"""Tokenizing of numpad source for numpadparse.
+
+Importing this module will provide the following classes and objects:
+    Scanner : Splits numpad source into tokens with a single regular
+            | expression.
+    lexer   : Scanner object used by numpadparse.parser.parse.
+    tokens  : tuple of the names of every kind of token.
+
+PLY's lexer calls back into Python for every token it matches. Scanner
+matches the whole text with one compiled pattern instead, and only builds
+the tokens yacc reads.
+"""
+
+import re
+
+import ply.lex
+from ply.lex import LexToken
 
 tokens = (
     'D',
@@ -11,42 +27,93 @@ tokens = (
     'ZERO'
 )
 
-t_D = r'/'
-t_M = r'\*'
-t_S = r'-'
-t_A = r'\+'
-t_DOT = r'(?<!\n)\.'
-# t_ZERO = r'(?<!\d)0'
-t_ignore = r' '
+# Every token, in the order they are tried. Dots right after a newline are
+# indentation, and comments run up to and include their newline. Anything
+# else unexpected is matched one character at a time by ERROR.
+TOKEN_RE = re.compile(r"""
+    (?P<NUMBER>[1-9]\d*)
+  | (?P<ZERO>(?<![1-9])0)
+  | (?P<N>\n)
+  | (?P<INDENT>(?<=\n)\.+)
+  | (?P<COMMENT>\#[^\n]*\n)
+  | (?P<DOT>(?<!\n)\.)
+  | (?P<M>\*)
+  | (?P<A>\+)
+  | (?P<D>/)
+  | (?P<S>-)
+  | (?P<SPACE>[ ]+)
+  | (?P<ERROR>.)
+""", re.VERBOSE)
+
+# Matches that don't produce a token.
+SKIPPED = frozenset(('INDENT', 'COMMENT', 'SPACE'))
+
+
+class Scanner:
+    """Splits numpad source into tokens with a single regular expression.
+
+    Provides the input and token methods yacc expects of a lexer.
+
+    Attributes:
+        lineno  : int line of the last token returned, starting at 1.
+        _tokens : iterator over the LexToken objects not yet returned.
+    """
+
+    def __init__(self):
+        """Construct a Scanner with no input."""
+        self.lineno = 1
+        self._tokens = iter(())
+
+    def input(self, text):
+        """Split the given text into tokens, to be returned by token.
 
-def t_NUMBER(t):
-    r'([1-9]\d*)'
-    t.value = int(t.value)
-    return t
+        Parameters:
+            text : str of numpad source.
+        """
+        found = []
+        lineno = 1
+        for match in TOKEN_RE.finditer(text):
+            kind = match.lastgroup
+            if kind in SKIPPED:
+                if kind == 'COMMENT':
+                    lineno += 1
+                continue
+            if kind == 'ERROR':
+                print("Illegal character '%s'" % match.group()[0])
+                continue
 
-def t_ZERO(t):
-    r'(?<![1-9])0'
-    t.value = 0
-    return t
+            tok = LexToken()
+            tok.type = kind
+            tok.lineno = lineno
+            tok.lexpos = match.start()
+            if kind == 'NUMBER':
+                tok.value = int(match.group())
+            elif kind == 'ZERO':
+                tok.value = 0
+            else:
+                tok.value = match.group()
+                if kind == 'N':
+                    lineno += 1
+            found.append(tok)
+        self._tokens = iter(found)
 
-def t_N(t):
-    r'\n'
-    t.lexer.lineno += t.value.count('\n')
-    return t
+    def token(self):
+        """Get the next token.
 
-def t_whitespace(t):
-    r'(?<=\n)\.+'
-    pass
+        Returns:
+            LexToken object, or None once every token has been returned.
+        """
+        tok = next(self._tokens, None)
+        if tok is not None:
+            self.lineno = tok.lineno
+        return tok
 
-def t_comment(t):
-    r'\#[^\n]*\n'
-    pass
 
-def t_error(t):
-    print("Illegal character '%s'" % t.value[0])
-    t.lexer.skip(1)
+lexer = Scanner()
 
-lexer = lex.lex()
+# yacc falls back to PLY's module-level lexer when parse isn't given one.
+# lex.lex() sets it to each lexer it builds, so the Scanner takes its place.
+ply.lex.lexer = lexer
 
 if __name__ == "__main__":
     with open('test.txt', 'r', encoding='utf-8') as f:
@@ -58,4 +125,4 @@ if __name__ == "__main__":
         if not tok:
             break
         print(tok)
-        i += 1
\ No newline at end of file
+        i += 1
@@ -1,4 +1,3 @@
-from numpy import var
 import ply.yacc as yacc
 
 from numpadlex import tokens
@@ -119,13 +118,13 @@ def p_stmt_set_index(p):
     '''stmt_ind_open : set NUMBER D NUMBER
                      | set NUMBER D ZERO
                      | set NUMBER D var'''
-    p[0] = StatementSetIndex(p[2], [p[4]])
+    p[0] = StatementSetIndex(p[2], [Expression(p[4])])
 
 def p_stmt_set_sub_index(p):
     '''stmt_ind_open : stmt_ind_open D NUMBER
                      | stmt_ind_open D ZERO
                      | stmt_ind_open D var'''
-    p[1].add_sub_index(p[3])
+    p[1].add_sub_index(Expression(p[3]))
     p[0] = p[1]
 
 def p_stmt_set_index_close(p):
@@ -135,7 +134,7 @@ def p_stmt_set_index_close(p):
 
 def p_stmt_set_return(p):
     'stmt_ret : set ZERO ZERO DOT expr'
-    p[0] = StatementSet('00', p[5])
+    p[0] = StatementSet(0, p[5])
 
 def p_stmt_if(p):
     'stmt_if : if expr block'
@@ -175,6 +174,7 @@ def p_close_block(p):
     '''block : open_block N
     '''
     p[0] = p[1]
+    p[0].finalize()
 
 def p_program(p):
     'program : block'
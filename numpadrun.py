@@ -6,23 +6,103 @@ Importing this module will provide the following functions:
     load_program : Load and parse a given file, importing any files in its
                  | first line.
     run          : Run the numpad code written at the file given by file_path.
+
+By default, programs are compiled to Python functions by numpadgen. Setting
+BACKEND to 'tree' walks the parsed tree instead. Programs that fail to
+compile fall back to walking the tree, and the tree is always walked when
+VERBOSE is set. With JIT set, integer-only loops are also compiled natively
+by numpadjit, and either backend runs them through their kernels.
 """
 
+import hashlib
+import heapq
+import hmac
 import os
-
-from numpad import NumpadError, NullScope
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpad
+from numpad import NumpadError, NullScope, to_slot
+from numpadgen import RUNNER, CompileError, compile_block
+from numpadjit import jit_loops
+from numpadlex import lexer
 from numpadparse import parser
 
 VERBOSE = False
+JIT = False
+
+# How programs are run: 'python' or 'tree'.
+BACKEND = 'python'
+
+# Whether parsed programs are kept on disk, in CACHE_FOLDER.
+DISK_CACHE = False
+CACHE_FOLDER = os.path.join(
+    os.environ.get('XDG_CACHE_HOME')
+    or os.path.join(os.path.expanduser('~'), '.cache'),
+    'numpad'
+)
+
+# File in CACHE_FOLDER holding the random key cached programs are signed
+# with.
+CACHE_KEY_FILE = "key"
+CACHE_KEY_SIZE = 32
+
+# Changed whenever cached programs stop being loadable as they are.
+CACHE_VERSION = b"numpad-1"
+
+# Most files read at once while loading a program's imports.
+IMPORT_THREADS = 4
+
+# Size of the buffer each file is read through, so most files take a single
+# read call.
+READ_BUFFER = 128 * 1024
+
 
+# Text of each file read so far, with its modification time then, keyed by
+# canonical path.
+_TEXT_CACHE = {}
 
-def import_npd(file_path):
+# Parsed programs, keyed by their whole text and the flags that change how
+# they are built. Each maps to the StatementBlock and a dict of the code
+# compiled from it for each backend.
+_PROGRAM_CACHE = {}
+
+
+def _read_file(path):
+    """Read a file, returning the cached text if it is unchanged since then.
+
+    Parameters:
+        path : str path to the file, in any form.
+
+    Returns:
+        str of the file's whole text.
+
+    Paths are made canonical first, so the same file reached through
+    different relative paths is only read once.
+    """
+    path = os.path.realpath(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _TEXT_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8', buffering=READ_BUFFER) as file:
+        text = file.read()
+    _TEXT_CACHE[path] = (mtime, text)
+    return text
+
+
+def import_npd(file_path, prefetched=None):
     """Load the code found at the given file location, or in lib if not found.
 
     Parameters:
-        file_path : str of the filename EXCLUDING THE EXTENSION.
-                  | Folders can be included, but will be ignored in backup
-                  | file search.
+        file_path  : str of the filename EXCLUDING THE EXTENSION.
+                   | Folders can be included, but will be ignored in backup
+                   | file search.
+        prefetched : concurrent.futures.Future of _read_npd(file_path),
+                   | started ahead of time.
+                   | DEFAULT: None, meaning the file is read now.
 
     Returns:
         Raw text of the found npd file.
@@ -32,33 +112,92 @@ def import_npd(file_path):
     if VERBOSE:
         print("Loading", file_path)
 
+    if prefetched is not None:
+        return prefetched.result()
+    return _read_npd(file_path)
+
+
+def _read_npd(file_path):
+    """Find and read a file for import_npd, without printing anything."""
     if os.path.exists(f"{file_path}.npd"):
-        with open(f"{file_path}.npd", 'r', encoding='utf-8') as file:
-            text = file.read()
-        return text
+        return _read_file(f"{file_path}.npd")
 
     if os.path.exists(f"{file_path}.txt"):
-        with open(f"{file_path}.txt", 'r', encoding='utf-8') as file:
-            text = file.read()
-        return text
+        return _read_file(f"{file_path}.txt")
 
     file_name = os.path.basename(file_path)
 
     if os.path.exists(f"lib/{file_name}.npd"):
-        with open(f"lib/{file_name}.npd", 'r', encoding='utf-8') as file:
-            text = file.read()
-        return text
+        return _read_file(f"lib/{file_name}.npd")
 
     if os.path.exists(f"lib/{file_name}.txt"):
-        with open(f"lib/{file_name}.txt", 'r', encoding='utf-8') as file:
-            text = file.read()
-        return text
+        return _read_file(f"lib/{file_name}.txt")
 
     raise NumpadError(
         f"{file_name} could not be found. Import failed."
     )
 
 
+def _split_imports(text):
+    """Split the text of a file into its code and the files it imports.
+
+    Parameters:
+        text : str of the whole file, whose first line lists imports
+             | separated by '.'.
+
+    Returns:
+        tuple of the str code after the first line, and a list of the
+        imported file names, without repeats.
+    """
+    imports, body = text.split('\n', maxsplit=1)
+    return body, list(dict.fromkeys(imports.split('.'))) if imports else []
+
+
+def _join_imports(names, bodies, imported):
+    """Join the code of a program's files so every import comes first.
+
+    Parameters:
+        names    : list of str file names, in the order they were found.
+        bodies   : dict mapping each file name to its code.
+        imported : dict mapping each file name to the list of files it
+                 | imports.
+
+    Returns:
+        str of the whole program.
+
+    Files are ordered importers first, taking the earliest found file
+    whenever there is a choice, and the code is joined in the reverse of
+    that order. This is the order files have always been joined in, so
+    when two files set the same variable, the same one wins. A file
+    imported from several places is only included once, and a cycle of
+    imports is broken at its earliest found file.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    importers = dict.fromkeys(names, 0)
+    for name in names:
+        for im_file in imported[name]:
+            importers[im_file] += 1
+
+    ready = [0]
+    placed = set()
+    order = []
+    while len(order) < len(names):
+        if not ready:
+            ready.append(min(index[name] for name in names
+                             if name not in placed))
+        i = heapq.heappop(ready)
+        placed.add(names[i])
+        order.append(bodies[names[i]])
+        for im_file in imported[names[i]]:
+            importers[im_file] -= 1
+            if importers[im_file] == 0 and im_file not in placed:
+                heapq.heappush(ready, index[im_file])
+
+    order.reverse()
+    order.append("\n")
+    return ''.join(order)
+
+
 def load_program(file_path):
     """Load and parse a given file, importing any files in its first line.
 
@@ -68,8 +207,24 @@ def load_program(file_path):
     Returns:
         numpad.StatementBlock object that can be run, provided a Scope
 
+    Operations between constants are folded once the program is parsed,
+    unless VERBOSE is set, so that every step can still be printed. With
+    JIT set, loops are given their numpadjit kernels then too. A program
+    whose text was parsed before is returned from _PROGRAM_CACHE rather
+    than parsed again.
+
     Raises an error if file_path cannot be found.
     """
+    return _load(file_path)[0]
+
+
+def _load(file_path):
+    """Load a program as load_program does, along with its compiled code.
+
+    Returns:
+        tuple of the StatementBlock object and the dict of code compiled
+        from it for each backend so far.
+    """
     if not (os.path.exists(f"{file_path}.npd") or
             os.path.exists(f"{file_path}.txt")):
         raise NumpadError(
@@ -80,39 +235,29 @@ def load_program(file_path):
     file_name = os.path.basename(file_path)
     folder = os.path.dirname(full_path)
 
-    files = [file_name]
-    texts = [None]
-    i = 0
+    # Read every file once, breadth-first, numbering them in that order.
+    # Each file is read on another thread as soon as it is found, while the
+    # files found before it are still being handled.
+    names = [file_name]
+    found = {file_name}
+    bodies = {}
+    imported = {}
+    reads = {}
+    with ThreadPoolExecutor(max_workers=IMPORT_THREADS) as pool:
+        for name in names:
+            bodies[name], imported[name] = _split_imports(import_npd(
+                os.path.join(folder, name), reads.pop(name, None)
+            ))
+            for im_file in imported[name]:
+                if im_file not in found:
+                    found.add(im_file)
+                    names.append(im_file)
+                    reads[im_file] = pool.submit(
+                        _read_npd, os.path.join(folder, im_file)
+                    )
+
+    final_text = _join_imports(names, bodies, imported)
 
-    while i < len(files):
-        if texts[i]:
-            text = texts[i]
-        else:
-            text = import_npd(os.path.join(folder, files[i]))
-
-        imports, _ = text.split('\n', maxsplit=1)
-        texts[i] = text
-        d_i = 1
-
-        if imports:
-            for im_file in imports.split('.'):
-                if im_file in files[:i]:
-                    j = files.index(im_file)
-                    files.append(im_file)
-                    del files[j]
-                    texts.append(texts[j])
-                    del texts[j]
-                    d_i -= 1
-                else:
-                    files.append(im_file)
-                    texts.append(None)
-
-        i += d_i
-
-    final_text = "\n"
-    for text in texts:
-        final_text = text.split('\n', maxsplit=1)[1] + final_text
-    
     if VERBOSE:
         to_print = '\n'.join(f"{str(i)}\t{line}"
                              for i, line in enumerate(
@@ -121,10 +266,128 @@ def load_program(file_path):
                              )
         print(to_print.split('\n', maxsplit=1)[1])
 
-    program = parser.parse(final_text)
+    # numpad.VERBOSE may have been assigned rather than set through
+    # set_verbose, so bring the methods in line with it before parsing.
+    numpad.set_verbose(numpad.VERBOSE)
+
+    key = (final_text, numpad.VERBOSE, numpad.MEMOIZE, JIT)
+    if key not in _PROGRAM_CACHE:
+        program = _parse(final_text)
+        if not numpad.VERBOSE:
+            program.simplify()
+            if JIT:
+                jit_loops(program)
+        _PROGRAM_CACHE[key] = (program, {})
+    return _PROGRAM_CACHE[key]
+
+
+def _cache_key():
+    """Get the key cached programs are signed with, making it if needed.
+
+    Returns:
+        bytes of the key, or None if it can't be read or made.
+
+    The key is random, made once per user, and only readable by them. A
+    new key is written to a temporary file and renamed into place, so a
+    key is never read half written. Should two processes make one at
+    once, the last rename wins, and the programs the other cached are
+    parsed again.
+    """
+    key_path = os.path.join(CACHE_FOLDER, CACHE_KEY_FILE)
+    try:
+        with open(key_path, 'rb') as file:
+            key = file.read()
+        if len(key) == CACHE_KEY_SIZE:
+            return key
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return None
+
+    try:
+        os.makedirs(CACHE_FOLDER, mode=0o700, exist_ok=True)
+        key = os.urandom(CACHE_KEY_SIZE)
+        descriptor, temp_path = tempfile.mkstemp(dir=CACHE_FOLDER)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(key)
+            os.replace(temp_path, key_path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+        return key
+    except OSError:
+        return None
+
+
+def _parse(text):
+    """Parse the whole text of a program, through the on-disk cache.
+
+    Parameters:
+        text : str of the program, with its imports in place.
+
+    Returns:
+        numpad.StatementBlock object, not yet simplified.
+
+    With DISK_CACHE set, the parsed program is pickled to CACHE_FOLDER under
+    a hash of its text, and later loads of the same text read it from
+    there. Each file starts with an HMAC of the pickle under the key from
+    _cache_key, and is only unpickled if that matches, since unpickling
+    runs code. A cache that can't be read, checked or written is ignored.
+    """
+    if not DISK_CACHE:
+        return parser.parse(text, lexer=lexer)
+    key = _cache_key()
+    if key is None:
+        return parser.parse(text, lexer=lexer)
+
+    digest = hashlib.blake2b(CACHE_VERSION + text.encode(),
+                             digest_size=16).hexdigest()
+    cache_path = os.path.join(CACHE_FOLDER, f"{digest}.pkl")
+    try:
+        with open(cache_path, 'rb') as file:
+            data = file.read()
+        mac, data = data[:32], data[32:]
+        if hmac.compare_digest(mac, hmac.digest(key, data, 'sha256')):
+            return pickle.loads(data)
+    except Exception:
+        pass
+
+    program = parser.parse(text, lexer=lexer)
+    if program is None:
+        return program
+    try:
+        data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        temp_path = f"{cache_path}.{os.getpid()}"
+        with open(temp_path, 'wb') as file:
+            file.write(hmac.digest(key, data, 'sha256'))
+            file.write(data)
+        os.replace(temp_path, cache_path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        pass
     return program
 
 
+def _compiled(program, codes):
+    """Compile a program to a Python function, or get the one made before.
+
+    Parameters:
+        program : StatementBlock object returned by load_program.
+        codes   : dict of the code already compiled from program, as cached
+                | alongside it in _PROGRAM_CACHE.
+
+    Returns:
+        function made by numpadgen.compile_block, or None if the program
+        could not be compiled and should be walked instead.
+    """
+    if 'python' not in codes:
+        try:
+            codes['python'] = compile_block(program)
+        except CompileError:
+            codes['python'] = None
+    return codes['python']
+
+
 def run(file_path, param=None, param_delim=','):
     """Run the numpad code written at the file given by file_path.
 
@@ -140,7 +403,9 @@ def run(file_path, param=None, param_delim=','):
 
     Raises an error if file_path cannot be found.
     """
-    program = load_program(file_path)
+    program, codes = _load(file_path)
+
+    scope = NullScope()
 
     if param:
         variables = {
@@ -149,16 +414,23 @@ def run(file_path, param=None, param_delim=','):
                 param.split(param_delim)
             )
         }
+        for name, val in variables.items():
+            scope.set_value(to_slot(name), val)
         if VERBOSE:
             print("Loaded parameters:", variables)
     else:
-        variables = {}
         if VERBOSE:
             print("No parameters loaded.")
 
-    scope = NullScope(variables)
-    scope.set_value("*00", 0)
+    scope.set_value(0, 0)
 
-    program.run(scope)
+    if VERBOSE or BACKEND == 'tree':
+        program.run(scope)
+    else:
+        code = _compiled(program, codes)
+        if code is None:
+            program.run(scope)
+        else:
+            RUNNER.run(code, scope)
 
-    return scope.get_value("*00")
+    return scope.get_value(0)